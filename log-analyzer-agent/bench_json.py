@@ -0,0 +1,82 @@
+"""
+JSON 编解码基准测试
+用法: python bench_json.py [行数...]
+示例: python bench_json.py 1000 20000 100000
+
+在合成的 var log_result= 响应上，对比各 JSON 后端在热点路径上的耗时：
+- 解码整个 log_result（fetch_error_log）
+- 编码 jsonHeader 条目（fetch_error_log）
+- 带缩进编码工具结果（execute_tool）
+- parse_log_response 端到端
+"""
+
+import sys
+import time
+from typing import Callable, List
+
+import json_codec
+import log_service
+from sample_logs import make_log_result
+
+LOG_RESULT_PREFIX = log_service.LOG_RESULT_PREFIX.encode("utf-8")
+
+
+def best_of(fn: Callable[[], object], repeat: int = 5) -> float:
+    """多次运行取最短耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def available_codecs() -> List[object]:
+    """返回当前环境可用的所有后端"""
+    codecs = []
+    for name in ("json", "orjson", "msgspec"):
+        try:
+            codecs.append(json_codec.get_codec(name))
+        except ImportError:
+            print(f"⚠️  未安装 {name}，跳过")
+    return codecs
+
+
+def bench(lines: int, codecs: List[object]):
+    payload = make_log_result(lines, json_headers=max(2, lines // 100))
+    print(f"\n📦 {lines} 行日志，响应大小 {len(payload) / 1024 / 1024:.2f} MB")
+    print(f"{'后端':<10}{'解码 log_result':>18}{'编码 jsonHeader':>18}{'编码工具结果':>16}{'端到端解析':>14}")
+
+    baseline = None
+    for codec in codecs:
+        log_data = codec.loads(payload, len(LOG_RESULT_PREFIX))
+        headers = [item for item in log_data["result"] if "jsonHeader" in item]
+        tool_result = {"event_id": "DJC-CF-1211212348-8RJKIC-529-425718", "logs": log_data["result"][:1000]}
+
+        decode = best_of(lambda: codec.loads(payload, len(LOG_RESULT_PREFIX)))
+        encode_headers = best_of(lambda: [codec.dumps(item) for item in headers])
+        encode_result = best_of(lambda: codec.dumps(tool_result, indent=True))
+
+        # 端到端：临时切换 json_codec 使用的后端
+        previous, json_codec._codec = json_codec._codec, codec
+        try:
+            end_to_end = best_of(lambda: log_service.parse_log_response(payload))
+        finally:
+            json_codec._codec = previous
+
+        row = (decode, encode_headers, encode_result, end_to_end)
+        if baseline is None:
+            baseline = row
+        speedup = baseline[3] / end_to_end if end_to_end else float("inf")
+        print(
+            f"{codec.name:<10}{decode:>15.2f} ms{encode_headers:>15.2f} ms"
+            f"{encode_result:>13.2f} ms{end_to_end:>11.2f} ms  (x{speedup:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 20000, 100000]
+    print(f"当前默认后端: {json_codec.backend_name()}")
+    codecs = available_codecs()
+    for size in sizes:
+        bench(size, codecs)
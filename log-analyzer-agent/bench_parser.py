@@ -0,0 +1,65 @@
+"""
+日志行解析基准测试
+用法: python bench_parser.py [行数...]
+示例: python bench_parser.py 100000
+
+在合成的 DJC 日志上测量 log_parser 的吞吐（行/秒、MB/秒）、
+LogRecord 与原始字符串的内存占用，以及列式存储（log_store）的大小和过滤耗时。
+"""
+
+import sys
+import time
+import tracemalloc
+
+from log_parser import parse_lines
+from log_store import LogStore
+from sample_logs import make_log_lines
+
+
+def bench(count: int, repeat: int = 3):
+    lines = make_log_lines(count)
+    size_mb = sum(len(line.encode("utf-8")) for line in lines) / 1024 / 1024
+    print(f"\n📦 {count} 行日志，{size_mb:.2f} MB")
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = list(parse_lines(lines))
+        best = min(best, time.perf_counter() - start)
+    parsed = sum(1 for record in records if record.is_parsed)
+    print(f"解析: {best * 1000:.1f} ms, {count / best:,.0f} 行/秒, {size_mb / best:.1f} MB/秒 (成功 {parsed}/{count})")
+
+    # 内存：原始拼接字符串 vs LogRecord 列表
+    tracemalloc.start()
+    joined = "\n".join(lines)
+    joined_bytes = tracemalloc.get_traced_memory()[0]
+    del joined
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    records = list(parse_lines(lines))
+    records_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(
+        f"内存: 拼接字符串 {joined_bytes / 1024 / 1024:.1f} MB, "
+        f"LogRecord 列表 {records_bytes / 1024 / 1024:.1f} MB ({records_bytes / count:.0f} 字节/行)"
+    )
+
+    start = time.perf_counter()
+    store = LogStore.from_records(records)
+    elapsed = time.perf_counter() - start
+    store_bytes = store.nbytes()
+    print(
+        f"列式存储: 构建 {elapsed * 1000:.1f} ms, {store_bytes / 1024 / 1024:.1f} MB "
+        f"({store_bytes / count:.0f} 字节/行，其中 IP 字典 {store.ips.nbytes() / count:.0f} 字节/行)"
+    )
+
+    start = time.perf_counter()
+    rows = store.query(levels=["ER"], module_prefix="app.coupon", start="2025-12-18 10:00:10")
+    print(f"过滤 ER + app.coupon* + 时间范围: {(time.perf_counter() - start) * 1000:.2f} ms, {len(rows)} 行")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000]
+    for size in sizes:
+        bench(size)
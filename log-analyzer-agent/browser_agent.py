@@ -24,7 +24,7 @@ load_dotenv()
 
 
 # ============ 配置 ============
-LOG_PAGE_URL = "http://help.ied.com/helpv2/html/showInfo_v2.html"
+LOG_PAGE_URL = os.getenv("LOG_PAGE_URL", "http://help.ied.com/helpv2/html/showInfo_v2.html")
 
 
 # ============ 数据模型 ============
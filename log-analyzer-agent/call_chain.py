@@ -0,0 +1,289 @@
+"""
+调用链索引
+- 按 (流水号, 模块) 把日志行归为一条调用链，按出现顺序记录每一步的 [源文件:行号]、级别和时间
+- 同一位置连续出现的行合并为一步（×次数）
+- 记录每条调用链的首个 ERROR 位置、步骤之间的耗时和总耗时
+- 输出紧凑的调用链摘要：模型读几十行调用链，而不是从几千行无序日志里自己还原
+- 按块加入日志（add_block），时间戳用 log_parser.parse_timestamps 向量化解码；
+  步骤耗时分析（log_latency）直接复用每块的调用链归属和时间戳，不再分组、解码一遍
+
+示例:
+    index = CallChainIndex().add_all(parse_lines(lines))
+    print(index.summary())
+"""
+
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from log_parser import LEVEL_ERROR, LogRecord, parse_timestamps
+
+# ============ 配置 ============
+# 摘要中最多列出的调用链数
+CALL_CHAIN_LIMIT = int(os.getenv("LOG_CALL_CHAIN_LIMIT", "5"))
+# 每条调用链最多列出的步骤数，超出时保留开头、首个 ERROR 附近和结尾
+CALL_CHAIN_STEPS = int(os.getenv("LOG_CALL_CHAIN_STEPS", "12"))
+# 每条调用链最多记录的步骤数，超出后只更新行数和结束时间
+CALL_CHAIN_MAX_STEPS = 200
+# 最多记录的调用链数，超出后新的调用链忽略
+CALL_CHAIN_MAX_CHAINS = 1000
+# add_all 每次向量化解码时间戳的行数
+CALL_CHAIN_BLOCK_ROWS = 4096
+# 每步附带的日志内容最多字符数
+_MESSAGE_CHARS = 80
+# 开头、结尾各保留的步骤数
+_EDGE_STEPS = 2
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+
+
+def format_duration(ms: int) -> str:
+    """如 350ms、2.1s、3m05s"""
+    if ms < 1000:
+        return f"{ms}ms"
+    if ms < 60000:
+        return f"{ms / 1000:.1f}s"
+    return f"{ms // 60000}m{ms % 60000 // 1000:02d}s"
+
+
+class ChainStep:
+    """调用链中的一步：同一位置连续出现的一行或多行"""
+
+    __slots__ = ("src", "line", "level", "first_index", "count", "start_ms", "end_ms", "message")
+
+    def __init__(self, record: LogRecord, index: int, ms: Optional[int]):
+        self.src = record.src
+        self.line = record.line
+        self.level = record.level
+        self.first_index = index
+        self.count = 1
+        self.start_ms = ms
+        self.end_ms = ms
+        self.message = record.message
+
+    @property
+    def location(self) -> str:
+        return f"{self.src}:{self.line}"
+
+    def __repr__(self) -> str:
+        return f"ChainStep({self.location} {self.level} ×{self.count})"
+
+
+class CallChain:
+    """一个流水号在一个模块内的调用链"""
+
+    __slots__ = ("serial", "module", "ordinal", "steps", "lines", "errors", "first_error", "dropped")
+
+    def __init__(self, serial: str, module: str, ordinal: int = 0):
+        self.serial = serial
+        self.module = module
+        # 在索引中的创建顺序，从 0 开始
+        self.ordinal = ordinal
+        self.steps: List[ChainStep] = []
+        self.lines = 0
+        self.errors = 0
+        # 首个 ERROR 所在步骤的下标
+        self.first_error: Optional[int] = None
+        # 超出 CALL_CHAIN_MAX_STEPS 未记录的步骤数
+        self.dropped = 0
+
+    def add(self, record: LogRecord, index: int, ms: Optional[int] = None):
+        """加入一行日志，ms 为该行的毫秒时间戳，没有时为 None"""
+        self.lines += 1
+        is_error = record.level == LEVEL_ERROR
+        if is_error:
+            self.errors += 1
+
+        last = self.steps[-1] if self.steps else None
+        if last is not None and (last.src, last.line, last.level) == (record.src, record.line, record.level):
+            last.count += 1
+            if ms is not None:
+                last.end_ms = max(ms, last.end_ms if last.end_ms is not None else ms)
+        elif len(self.steps) < CALL_CHAIN_MAX_STEPS or (is_error and self.first_error is None):
+            self.steps.append(ChainStep(record, index, ms))
+        else:
+            self.dropped += 1
+            if ms is not None and last is not None:
+                last.end_ms = max(ms, last.end_ms if last.end_ms is not None else ms)
+
+        if is_error and self.first_error is None:
+            self.first_error = len(self.steps) - 1
+
+    # 多台机器的日志可能乱序，起止时间取最小 / 最大值
+    @property
+    def start_ms(self) -> Optional[int]:
+        return min((step.start_ms for step in self.steps if step.start_ms is not None), default=None)
+
+    @property
+    def end_ms(self) -> Optional[int]:
+        return max((step.end_ms for step in self.steps if step.end_ms is not None), default=None)
+
+    @property
+    def elapsed_ms(self) -> Optional[int]:
+        start, end = self.start_ms, self.end_ms
+        return end - start if start is not None and end is not None else None
+
+    def selected_steps(self, limit: int = CALL_CHAIN_STEPS) -> List[int]:
+        """要列出的步骤下标：步骤太多时保留开头、首个 ERROR 附近和结尾"""
+        total = len(self.steps)
+        if total <= limit:
+            return list(range(total))
+        focus = self.first_error if self.first_error is not None else total - 1
+        window = max(1, limit - 2 * _EDGE_STEPS)
+        before = (window - 1) * 2 // 3
+        start = max(0, min(focus - before, total - window))
+        keep = {*range(_EDGE_STEPS), *range(start, start + window), *range(total - _EDGE_STEPS, total)}
+        return sorted(keep)
+
+    def render(self, number: int, limit: int = CALL_CHAIN_STEPS) -> List[str]:
+        """
+        调用链文本:
+            [CHAIN 1] DJC-CF-...-000123 app.order.create 10:00:01 → 10:00:04（3.0s）18 行 9 步，ER 2，首个 ERROR 在第 5 步
+              → 1 [OrderService.php:40] INF request start, params=...
+              → 2 [OrderService.php:88] INF ×3 +200ms call backend svr=coupon_svr ...
+              → ... 省略 2 步 ...
+              → 5 [BaseModule.php:12] ER +2.1s ← 首个 ERROR call backend failed ret=-6712 ...
+        """
+        steps = self.steps
+        header = f"[CHAIN {number}] {self.serial} {self.module}"
+        start, end = self.start_ms, self.end_ms
+        if start is not None and end is not None:
+            header += f" {_clock(start)} → {_clock(end)}（{format_duration(end - start)}）"
+        else:
+            header += " "
+        header += f"{self.lines} 行 {len(steps) + self.dropped} 步"
+        if self.errors:
+            header += f"，ER {self.errors}"
+        if self.first_error is not None:
+            header += f"，首个 ERROR 在第 {self.first_error + 1} 步"
+        lines = [header]
+
+        previous = -1
+        for i in self.selected_steps(limit):
+            if i > previous + 1:
+                lines.append(f"  → ... 省略 {i - previous - 1} 步 ...")
+            step = steps[i]
+            text = f"  → {i + 1} [{step.location}] {step.level}"
+            if step.count > 1:
+                text += f" ×{step.count}"
+            gap = _gap(steps[i - 1], step) if i > 0 else None
+            if gap and gap > 0:
+                text += f" +{format_duration(gap)}"
+            if i == self.first_error:
+                text += " ← 首个 ERROR"
+            message = step.message
+            if len(message) > _MESSAGE_CHARS:
+                message = message[:_MESSAGE_CHARS] + "…"
+            lines.append(f"{text} {message}")
+            previous = i
+        if self.dropped:
+            lines.append(f"  → ... 之后另有 {self.dropped} 步未记录 ...")
+        return lines
+
+    def __repr__(self) -> str:
+        return f"CallChain({self.serial} {self.module} {len(self.steps)} 步, ER {self.errors})"
+
+
+def _gap(previous: ChainStep, step: ChainStep) -> Optional[int]:
+    if previous.end_ms is None or step.start_ms is None:
+        return None
+    return step.start_ms - previous.end_ms
+
+
+def _clock(ms: int) -> str:
+    """只显示时间部分，有毫秒时带毫秒"""
+    value = (_EPOCH + ms * _MS).strftime("%H:%M:%S.%f")[:-3]
+    return value[:-4] if value.endswith(".000") else value
+
+
+class CallChainIndex:
+    """
+    流式构建的调用链索引
+
+    示例:
+        index = CallChainIndex()
+        for block in blocks:  # [(行号, LogRecord), ...]
+            index.add_block(block)
+        for chain in index.ranked():
+            ...
+    """
+
+    def __init__(self):
+        self.chains: Dict[Tuple[str, str], CallChain] = {}
+        self.lines = 0
+        # 超出 CALL_CHAIN_MAX_CHAINS 未记录的行数
+        self.dropped = 0
+
+    def add(self, record: LogRecord, index: Optional[int] = None, ms: Optional[int] = None) -> Optional[CallChain]:
+        """
+        加入一行日志，返回所属调用链；没有流水号的行忽略
+
+        index 为该行在日志中的行号，默认按加入顺序；ms 为毫秒时间戳，没有时为 None（不计算耗时）。
+        """
+        index = self.lines if index is None else index
+        self.lines += 1
+        if not record.serial:
+            return None
+        key = (record.serial, record.module)
+        chain = self.chains.get(key)
+        if chain is None:
+            if len(self.chains) >= CALL_CHAIN_MAX_CHAINS:
+                self.dropped += 1
+                return None
+            chain = self.chains[key] = CallChain(*key, ordinal=len(self.chains))
+        chain.add(record, index, ms)
+        return chain
+
+    def add_block(self, block: Sequence[Tuple[int, LogRecord]]) -> Tuple[List[Optional[CallChain]], np.ndarray]:
+        """
+        按日志顺序加入一块 (行号, 记录)，时间戳向量化解码
+
+        返回每行所属的调用链（没有流水号或超出上限时为 None）和 datetime64[ms] 时间戳数组（无法解析为 NaT）。
+        """
+        parsed = parse_timestamps([record.timestamp for _, record in block])
+        valid = (~np.isnat(parsed)).tolist()
+        ms = parsed.astype(np.int64).tolist()
+        chains = [
+            self.add(record, index, ms[row] if valid[row] else None)
+            for row, (index, record) in enumerate(block)
+        ]
+        return chains, parsed
+
+    def add_all(self, records: Iterable[LogRecord]) -> "CallChainIndex":
+        numbered = enumerate(records, self.lines)
+        while True:
+            block = list(islice(numbered, CALL_CHAIN_BLOCK_ROWS))
+            if not block:
+                return self
+            self.add_block(block)
+
+    def get(self, serial: str, module: str) -> Optional[CallChain]:
+        return self.chains.get((serial, module))
+
+    def ranked(self) -> List[CallChain]:
+        """含 ERROR 的调用链，按首个 ERROR 出现的顺序"""
+        chains = [chain for chain in self.chains.values() if chain.first_error is not None]
+        return sorted(chains, key=lambda chain: chain.steps[chain.first_error].first_index)
+
+    def summary(self, limit: int = CALL_CHAIN_LIMIT, steps: int = CALL_CHAIN_STEPS) -> str:
+        """含 ERROR 的调用链摘要，没有时返回空字符串"""
+        chains = self.ranked()
+        if not chains:
+            return ""
+        serials = len({serial for serial, _ in self.chains})
+        lines = [
+            f"[CHAINS] {serials} 个流水号共 {len(self.chains)} 条调用链（流水号 × 模块），"
+            f"其中 {len(chains)} 条含 ERROR，按首个 ERROR 出现顺序列出前 {min(limit, len(chains))} 条"
+        ]
+        for number, chain in enumerate(chains[:limit], 1):
+            lines.extend(chain.render(number, steps))
+        return "\n".join(lines)
+
+
+def build_call_chains(records: Iterable[LogRecord]) -> CallChainIndex:
+    """对一组日志建立调用链索引"""
+    return CallChainIndex().add_all(records)
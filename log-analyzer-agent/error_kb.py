@@ -0,0 +1,230 @@
+"""
+错误码知识库
+- 源文件 error_codes.json: (平台, 模块, 错误码) -> 含义、风险等级、服务状态（可选）、处理建议，平台和模块可用 "*" 表示任意
+- 首次使用时编译为二进制索引文件（开放寻址哈希表），之后通过 mmap 只读加载：
+  不需要解析 JSON，多个进程共享同一份页缓存，单次查找为 O(1)
+- 源文件修改后自动重新编译
+- 查找时依次尝试: (平台, 模块) -> (平台, 上级模块...) -> (平台, *) -> (*, 模块) -> ... -> (*, *)
+
+索引文件格式（小端）:
+    header: magic(4s) version(H) reserved(H) slot_count(I) entry_count(I) source_mtime_ns(q) source_size(q)
+    slots:  slot_count 个 (key_hash(Q), offset(I), length(I))，key_hash 为 0 表示空槽
+    data:   每个条目一段 UTF-8 JSON
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+import json_codec
+from log_parser import LEVEL_ERROR, LogRecord, extract_error_code
+
+# ============ 配置 ============
+_HERE = os.path.dirname(os.path.abspath(__file__))
+ERROR_KB_SOURCE = os.getenv("ERROR_KB_SOURCE", os.path.join(_HERE, "error_codes.json"))
+ERROR_KB_INDEX = os.getenv("ERROR_KB_INDEX", os.path.join(_HERE, ".cache", "error_codes.idx"))
+# 注入工具结果时最多列出的错误码数
+ERROR_KB_ANNOTATE_LIMIT = int(os.getenv("ERROR_KB_ANNOTATE_LIMIT", "10"))
+
+ANY = "*"
+_MAGIC = b"EKB1"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHIIqq")
+_SLOT = struct.Struct("<QII")
+
+
+class ErrorCodeEntry(BaseModel):
+    """知识库中的一条错误码"""
+    platform: str = ANY
+    module: str = ANY
+    code: str
+    meaning: str
+    risk_level: str  # low / medium / high / critical
+    recommendation: str
+    server_status: str = ""  # 规则引擎报告中的服务状态，为空时按含义生成
+
+
+def _key_hash(platform: str, module: str, code: str) -> int:
+    digest = hashlib.blake2b(f"{platform}\x1f{module}\x1f{code}".encode("utf-8"), digest_size=8).digest()
+    # 0 保留为空槽
+    return int.from_bytes(digest, "little") or 1
+
+
+def compile_kb(source: str = ERROR_KB_SOURCE, index: str = ERROR_KB_INDEX) -> int:
+    """把 JSON 源文件编译为索引文件，返回条目数"""
+    with open(source, "rb") as f:
+        raw = f.read()
+    entries = [ErrorCodeEntry(**item) for item in json_codec.loads(raw)]
+    stat = os.stat(source)
+
+    slot_count = 8
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+    slots: List[Tuple[int, int, int]] = [(0, 0, 0)] * slot_count
+
+    data = bytearray()
+    data_start = _HEADER.size + _SLOT.size * slot_count
+    for entry in entries:
+        blob = json_codec.dumps(entry.model_dump()).encode("utf-8")
+        key_hash = _key_hash(entry.platform, entry.module, entry.code)
+        i = key_hash & (slot_count - 1)
+        while slots[i][0]:
+            i = (i + 1) & (slot_count - 1)
+        slots[i] = (key_hash, data_start + len(data), len(blob))
+        data += blob
+
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    # 先写临时文件再替换，其他进程不会读到写了一半的索引
+    tmp = f"{index}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, 0, slot_count, len(entries), stat.st_mtime_ns, stat.st_size))
+        for slot in slots:
+            f.write(_SLOT.pack(*slot))
+        f.write(data)
+    os.replace(tmp, index)
+    return len(entries)
+
+
+class ErrorCodeKB:
+    """通过 mmap 只读加载的错误码知识库"""
+
+    def __init__(self, index: str = ERROR_KB_INDEX):
+        self.index = index
+        with open(index, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.slot_count, self.entry_count, self.source_mtime_ns, self.source_size = (
+            _HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise ValueError(f"不是有效的错误码索引文件: {index}")
+        self._cache: Dict[Tuple[str, str, str], Optional[ErrorCodeEntry]] = {}
+
+    @classmethod
+    def load(cls, source: str = ERROR_KB_SOURCE, index: str = ERROR_KB_INDEX) -> "ErrorCodeKB":
+        """加载索引，索引不存在或源文件已修改时先重新编译"""
+        stat = os.stat(source)
+        try:
+            kb = cls(index)
+            if kb.source_mtime_ns == stat.st_mtime_ns and kb.source_size == stat.st_size:
+                return kb
+            kb.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        count = compile_kb(source, index)
+        print(f"  📚 已编译错误码知识库: {count} 条 -> {index}")
+        return cls(index)
+
+    def _get(self, platform: str, module: str, code: str) -> Optional[ErrorCodeEntry]:
+        key_hash = _key_hash(platform, module, code)
+        mask = self.slot_count - 1
+        i = key_hash & mask
+        for _ in range(self.slot_count):
+            slot_hash, offset, length = _SLOT.unpack_from(self._mmap, _HEADER.size + i * _SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == key_hash:
+                entry = ErrorCodeEntry(**json_codec.loads(self._mmap[offset:offset + length]))
+                if (entry.platform, entry.module, entry.code) == (platform, module, code):
+                    return entry
+            i = (i + 1) & mask
+        return None
+
+    def lookup(self, platform: str, module: str, code: str) -> Optional[ErrorCodeEntry]:
+        """查找最具体的匹配条目，没有时返回 None"""
+        if not code:
+            return None
+        key = (platform, module, code)
+        if key in self._cache:
+            return self._cache[key]
+
+        # app.coupon.available -> app.coupon -> app -> *
+        modules = [module] if module else []
+        while "." in module:
+            module = module.rsplit(".", 1)[0]
+            modules.append(module)
+        modules.append(ANY)
+
+        entry = None
+        for plat in (platform, ANY) if platform and platform != ANY else (ANY,):
+            for mod in modules:
+                entry = self._get(plat, mod, code)
+                if entry is not None:
+                    break
+            if entry is not None:
+                break
+        self._cache[key] = entry
+        return entry
+
+    def annotate(
+        self,
+        records: Iterable[LogRecord],
+        platform: str = "",
+        limit: int = ERROR_KB_ANNOTATE_LIMIT,
+    ) -> List[str]:
+        """
+        ERROR 行中已知错误码的说明，每个知识库条目一行:
+            [KB] -6712 ×23 [app.user.login 9, app.order.create 6]: 系统繁忙… | 风险: high | 建议: …
+        """
+        return self.annotate_counts(count_error_codes(records), platform, limit)
+
+    def annotate_counts(
+        self,
+        counts: Counter,
+        platform: str = "",
+        limit: int = ERROR_KB_ANNOTATE_LIMIT,
+    ) -> List[str]:
+        """同 annotate，输入为 count_error_codes 的结果（便于流式累计）"""
+        # 同一条目可能对应多个模块，合并为一行
+        matched: Dict[Tuple[str, str, str], Tuple[ErrorCodeEntry, Counter]] = {}
+        for (module, code), count in counts.items():
+            entry = self.lookup(platform, module, code)
+            if entry is not None:
+                key = (entry.platform, entry.module, entry.code)
+                matched.setdefault(key, (entry, Counter()))[1][module] += count
+
+        ranked = sorted(matched.values(), key=lambda item: -sum(item[1].values()))
+        lines = []
+        for entry, modules in ranked[:limit]:
+            top = ", ".join(f"{module} {n}" for module, n in modules.most_common(3))
+            lines.append(
+                f"[KB] {entry.code} ×{sum(modules.values())} [{top}]: {entry.meaning} "
+                f"| 风险: {entry.risk_level} | 建议: {entry.recommendation}"
+            )
+        return lines
+
+    def close(self):
+        self._mmap.close()
+
+
+def count_error_codes(records: Iterable[LogRecord], counts: Optional[Counter] = None) -> Counter:
+    """按 (模块, 错误码) 统计 ERROR 行，counts 不为空时累加到其中"""
+    counts = Counter() if counts is None else counts
+    for record in records:
+        if record.level == LEVEL_ERROR:
+            code = extract_error_code(record.message)
+            if code:
+                counts[(record.module, code)] += 1
+    return counts
+
+
+_default_kb: Optional[ErrorCodeKB] = None
+_kb_loaded = False
+
+
+def get_error_kb() -> Optional[ErrorCodeKB]:
+    """获取进程内共享的知识库，源文件不存在或无法加载时返回 None"""
+    global _default_kb, _kb_loaded
+    if not _kb_loaded:
+        _kb_loaded = True
+        if os.path.exists(ERROR_KB_SOURCE):
+            try:
+                _default_kb = ErrorCodeKB.load()
+            except (OSError, ValueError) as e:
+                print(f"  ⚠️  错误码知识库加载失败: {e}")
+    return _default_kb
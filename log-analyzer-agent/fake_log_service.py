@@ -0,0 +1,267 @@
+"""
+本地日志服务替身（模拟 curl2.php）
+用法: python fake_log_service.py [--port 8765] [--lines 5000] [--latency 50] ...
+示例: python fake_log_service.py --lines 20000 --latency 80 --error-rate 0.02 --chunked
+      LOG_SERVICE_URL=http://127.0.0.1:8765/logplat/curl2.php python test_fetch.py --bench 500
+
+- /logplat/curl2.php: 返回 var log_result= 响应
+  - 默认返回合成日志（见 sample_logs），--replay DIR 时回放录制的响应
+    （DIR/<EventID>.js，可用 python test_fetch.py <EventID> --save DIR 录制；
+    没有对应文件时按 EventID 哈希固定选用其中一个）
+  - 可注入延迟、5xx 错误、登录跳转页、空结果，可使用分块传输（chunked）并限速
+- /helpv2/html/showInfo_v2.html?p=<EventID>: 简单的日志展示页，供 browser_agent.py 使用
+  （设置 LOG_PAGE_URL 指向此地址）
+"""
+
+import os
+import sys
+import html
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import json_codec
+from log_service import LOG_RESULT_PREFIX
+from sample_logs import make_log_result
+
+LOGIN_PAGE = (
+    "<html><head><meta charset=\"utf-8\"></head><body>"
+    "<p>未找到登录态，请先登录</p>"
+    "<script>urlJump('http://help.ied.com/login?ref=curl2.php')</script>"
+    "</body></html>"
+).encode("utf-8")
+
+
+class FakeLogServiceConfig:
+    """替身服务的行为配置"""
+
+    def __init__(
+        self,
+        lines: int = 5000,
+        variants: int = 4,
+        error_rate: float = 0.05,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        login_rate: float = 0.0,
+        not_found_rate: float = 0.0,
+        chunked: bool = False,
+        chunk_size: int = 16 * 1024,
+        chunk_delay_ms: float = 0.0,
+        replay_dir: Optional[str] = None,
+        seed: int = 0,
+    ):
+        self.lines = lines
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.login_rate = login_rate
+        self.not_found_rate = not_found_rate
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+        self.chunk_delay_ms = chunk_delay_ms
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+        # 预先生成响应，避免请求时的生成开销影响压测结果
+        self.recordings: Dict[str, bytes] = {}
+        if replay_dir:
+            for name in sorted(os.listdir(replay_dir)):
+                with open(os.path.join(replay_dir, name), "rb") as f:
+                    self.recordings[os.path.splitext(name)[0]] = f.read()
+            if not self.recordings:
+                raise ValueError(f"录制目录为空: {replay_dir}")
+            self.payloads: List[bytes] = list(self.recordings.values())
+        else:
+            self.payloads = [
+                make_log_result(lines, seed=seed + i, error_rate=error_rate)
+                for i in range(max(1, variants))
+            ]
+        self.empty_payload = (
+            LOG_RESULT_PREFIX + json_codec.dumps({"ret": 0, "msg": "ok", "total": 0, "result": []})
+        ).encode("utf-8")
+
+    def roll(self) -> float:
+        """本次请求的随机数，用于决定注入哪种故障"""
+        with self._rng_lock:
+            return self.rng.random()
+
+    def delay(self) -> float:
+        """本次请求的响应延迟（秒）"""
+        with self._rng_lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def payload_for(self, serial_num: str) -> bytes:
+        """按 EventID 选择响应：优先使用同名录制，否则按哈希固定选择一个"""
+        if serial_num in self.recordings:
+            return self.recordings[serial_num]
+        return self.payloads[zlib.crc32(serial_num.encode("utf-8")) % len(self.payloads)]
+
+
+class FakeLogServiceHandler(BaseHTTPRequestHandler):
+    """curl2.php 与日志展示页的请求处理"""
+
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive 与 chunked
+    server_version = "FakeLogService/1.0"
+
+    @property
+    def config(self) -> FakeLogServiceConfig:
+        return self.server.config
+
+    def do_GET(self):
+        parsed = urlsplit(self.path)
+        query = parse_qs(parsed.query)
+        self.server.requests_served += 1
+
+        if parsed.path.endswith("showInfo_v2.html"):
+            self._serve_page(query.get("p", [""])[0])
+        elif parsed.path.endswith("curl2.php"):
+            # 真实服务把参数嵌套在 url 参数里: url=plat_name=DJC&serial_num=...&source_charset=utf8
+            inner = parse_qs(query.get("url", [""])[0])
+            self._serve_log(inner.get("serial_num", [""])[0])
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _serve_log(self, serial_num: str):
+        config = self.config
+        delay = config.delay()
+        if delay:
+            time.sleep(delay)
+
+        roll = config.roll()
+        if roll < config.failure_rate:
+            self._send(503, b"Service Unavailable", "text/plain")
+        elif roll < config.failure_rate + config.login_rate:
+            self._send(200, LOGIN_PAGE, "text/html")
+        elif roll < config.failure_rate + config.login_rate + config.not_found_rate:
+            self._send(200, config.empty_payload, "application/javascript")
+        else:
+            self._send(200, config.payload_for(serial_num), "application/javascript")
+
+    def _serve_page(self, event_id: str):
+        """把日志渲染成简单的 HTML 页面"""
+        log_data = json_codec.loads(self.config.payload_for(event_id), offset=len(LOG_RESULT_PREFIX))
+        rows = "\n".join(
+            html.escape(item["content"]) for item in log_data.get("result", []) if "content" in item
+        )
+        page = (
+            f"<html><head><meta charset=\"utf-8\"><title>{html.escape(event_id)}</title></head>"
+            f"<body><h3>流水号: {html.escape(event_id)}</h3><pre id=\"log\">{rows}</pre></body></html>"
+        )
+        self._send(200, page.encode("utf-8"), "text/html")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        config = self.config
+        self.send_response(status)
+        # 与真实服务一致，不声明 charset
+        self.send_header("Content-Type", content_type)
+        try:
+            if config.chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for offset in range(0, len(body), config.chunk_size):
+                    chunk = body[offset:offset + config.chunk_size]
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    if config.chunk_delay_ms:
+                        self.wfile.flush()
+                        time.sleep(config.chunk_delay_ms / 1000)
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端超出下载预算后会提前关闭连接，属于正常情况
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(
+    config: FakeLogServiceConfig,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """创建替身服务（port=0 时随机分配端口）"""
+    server = ThreadingHTTPServer((host, port), FakeLogServiceHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.verbose = verbose
+    server.requests_served = 0
+    return server
+
+
+def start_in_background(config: Optional[FakeLogServiceConfig] = None, port: int = 0) -> ThreadingHTTPServer:
+    """
+    在后台线程启动替身服务，返回 server；server.shutdown() 停止
+
+    示例:
+        server = start_in_background(FakeLogServiceConfig(lines=1000))
+        get_log_client().base_url = service_url(server)
+    """
+    server = create_server(config or FakeLogServiceConfig(), port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def service_url(server: ThreadingHTTPServer) -> str:
+    """替身服务的 curl2.php 地址"""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/logplat/curl2.php"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 curl2.php 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--lines", type=int, default=5000, help="合成日志行数")
+    parser.add_argument("--variants", type=int, default=4, help="预生成的合成响应数量")
+    parser.add_argument("--log-error-rate", type=float, default=0.05, help="合成日志中 ER 行的比例")
+    parser.add_argument("--latency", type=float, default=0.0, help="响应延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动（±毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例")
+    parser.add_argument("--login-rate", type=float, default=0.0, help="返回登录跳转页的比例")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="返回空结果的比例")
+    parser.add_argument("--chunked", action="store_true", help="使用分块传输")
+    parser.add_argument("--chunk-size", type=int, default=16 * 1024, help="分块大小（字节）")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="每块之间的延迟（毫秒），模拟慢速下载")
+    parser.add_argument("--replay", metavar="DIR", help="回放录制的响应目录")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="打印访问日志")
+    args = parser.parse_args()
+
+    config = FakeLogServiceConfig(
+        lines=args.lines,
+        variants=args.variants,
+        error_rate=args.log_error_rate,
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        failure_rate=args.error_rate,
+        login_rate=args.login_rate,
+        not_found_rate=args.not_found_rate,
+        chunked=args.chunked,
+        chunk_size=args.chunk_size,
+        chunk_delay_ms=args.chunk_delay,
+        replay_dir=args.replay,
+        seed=args.seed,
+    )
+    server = create_server(config, args.host, args.port, args.verbose)
+    print(f"🧪 本地日志服务替身已启动: {service_url(server)}")
+    print(f"   响应数: {len(config.payloads)}, 平均大小: {sum(map(len, config.payloads)) / len(config.payloads) / 1024:.1f} KB")
+    print(f"   export LOG_SERVICE_URL={service_url(server)}")
+    print(f"   export LOG_PAGE_URL=http://{args.host}:{args.port}/helpv2/html/showInfo_v2.html")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+        sys.exit(0)
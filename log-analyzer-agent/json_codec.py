@@ -0,0 +1,120 @@
+"""
+可插拔的 JSON 编解码
+- 安装了 orjson 或 msgspec 时自动使用，否则回退到标准库 json
+- 可通过 LOG_JSON_BACKEND 指定：auto / orjson / msgspec / json
+- 解码错误统一抛出 json.JSONDecodeError，调用方无需关心后端
+"""
+
+import os
+import json
+from typing import Any, Union
+
+JSON_BACKEND = os.getenv("LOG_JSON_BACKEND", "auto")
+
+_std_decoder = json.JSONDecoder()
+# 与 json.loads 一致，解码前跳过前导空白（如 "var log_result= {...}" 等号后的空格）
+_WS = json.decoder.WHITESPACE
+
+
+class _StdlibCodec:
+    """标准库 json"""
+
+    name = "json"
+
+    def loads(self, data: Union[str, bytes], offset: int = 0) -> Any:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data[offset:]).decode("utf-8")
+            offset = 0
+        # raw_decode 可从偏移处直接解码，无需先切片复制
+        value, end = _std_decoder.raw_decode(data, _WS.match(data, offset).end())
+        if data[end:].strip():
+            raise json.JSONDecodeError("Extra data", data, end)
+        return value
+
+    def dumps(self, obj: Any, indent: bool = False) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+class _OrjsonCodec:
+    """orjson（Rust 实现）"""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._option = orjson.OPT_NON_STR_KEYS
+        self._indent_option = orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+
+    def loads(self, data: Union[str, bytes], offset: int = 0) -> Any:
+        if offset:
+            # memoryview 切片不复制底层字节
+            data = memoryview(data)[offset:] if isinstance(data, (bytes, bytearray)) else data[offset:]
+        # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
+        return self._orjson.loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> str:
+        return self._orjson.dumps(obj, option=self._indent_option if indent else self._option).decode("utf-8")
+
+
+class _MsgspecCodec:
+    """msgspec"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._msgspec = msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def loads(self, data: Union[str, bytes], offset: int = 0) -> Any:
+        if offset:
+            data = memoryview(data)[offset:] if isinstance(data, (bytes, bytearray)) else data[offset:]
+        try:
+            return self._decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), "", 0) from e
+
+    def dumps(self, obj: Any, indent: bool = False) -> str:
+        buf = self._encoder.encode(obj)
+        if indent:
+            buf = self._msgspec.json.format(buf, indent=2)
+        return buf.decode("utf-8")
+
+
+_CODECS = {
+    "orjson": _OrjsonCodec,
+    "msgspec": _MsgspecCodec,
+    "json": _StdlibCodec,
+}
+
+
+def get_codec(backend: str = JSON_BACKEND):
+    """按名称创建编解码器；auto 时按 orjson -> msgspec -> json 顺序选择第一个可用的"""
+    if backend != "auto":
+        return _CODECS[backend]()
+    for name in ("orjson", "msgspec"):
+        try:
+            return _CODECS[name]()
+        except ImportError:
+            continue
+    return _StdlibCodec()
+
+
+_codec = get_codec()
+
+
+def backend_name() -> str:
+    """当前使用的 JSON 后端名称"""
+    return _codec.name
+
+
+def loads(data: Union[str, bytes], offset: int = 0) -> Any:
+    """解码 JSON，offset 表示从 data 的第几个字符/字节开始（用于跳过 JS 前缀）"""
+    return _codec.loads(data, offset)
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """编码为 JSON 字符串（保留中文，不转义为 \\uXXXX），indent=True 时缩进 2 格"""
+    return _codec.dumps(obj, indent)
@@ -0,0 +1,221 @@
+"""
+日志缓存
+- 持久化在本地 SQLite 文件中，进程重启后依然有效
+- 以 (plat_name, serial_num) 为键，保存解析后的 log_result 文本
+- 支持 TTL 过期、按总字节数上限做 LRU 淘汰、命中/未命中统计
+- 另有进程内的短 TTL 负缓存，记录登录失效和日志不存在的结果
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+# ============ 配置 ============
+CACHE_PATH = os.getenv(
+    "LOG_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "log_cache.sqlite3")
+)
+CACHE_TTL = float(os.getenv("LOG_CACHE_TTL", str(24 * 3600)))  # 秒
+CACHE_MAX_BYTES = int(os.getenv("LOG_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# 设为 1 时跳过缓存读取，总是请求日志服务（结果仍会写入缓存）
+CACHE_BYPASS = os.getenv("LOG_CACHE_BYPASS", "0") == "1"
+
+# 负缓存 TTL（秒）：登录失效是全局的，恢复后需尽快重试；日志不存在按 EventID 记录
+NEGATIVE_AUTH_TTL = float(os.getenv("LOG_NEGATIVE_AUTH_TTL", "30"))
+NEGATIVE_NOT_FOUND_TTL = float(os.getenv("LOG_NEGATIVE_NOT_FOUND_TTL", "120"))
+# 登录失效的全局键
+AUTH_FAILURE_KEY = "__auth__"
+
+
+class LogCache:
+    """基于 SQLite 的持久化日志缓存（TTL + LRU）"""
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS log_cache (
+                plat_name   TEXT NOT NULL,
+                serial_num  TEXT NOT NULL,
+                content     TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (plat_name, serial_num)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_log_cache_accessed ON log_cache (accessed_at)")
+
+    def get(self, plat_name: str, serial_num: str) -> Optional[str]:
+        """读取缓存，过期或不存在时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM log_cache WHERE plat_name = ? AND serial_num = ?",
+                (plat_name, serial_num)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            content, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM log_cache WHERE plat_name = ? AND serial_num = ?",
+                    (plat_name, serial_num)
+                )
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE log_cache SET accessed_at = ? WHERE plat_name = ? AND serial_num = ?",
+                (now, plat_name, serial_num)
+            )
+            self.hits += 1
+            return content
+
+    def put(self, plat_name: str, serial_num: str, content: str):
+        """写入缓存，超出容量时按最近访问时间淘汰"""
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO log_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (plat_name, serial_num, content, size, now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        """删除最久未访问的条目，直到总大小不超过上限"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM log_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for plat_name, serial_num, size in self._conn.execute(
+            "SELECT plat_name, serial_num, size FROM log_cache ORDER BY accessed_at ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append((plat_name, serial_num))
+            total -= size
+
+        self._conn.executemany("DELETE FROM log_cache WHERE plat_name = ? AND serial_num = ?", victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM log_cache")
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM log_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class NegativeCache:
+    """
+    进程内的短 TTL 负缓存
+
+    保存失败结果的错误文本，在 TTL 内重复请求直接返回该文本，
+    不再访问日志服务。键可以是全局键（如 AUTH_FAILURE_KEY）或 (plat_name, serial_num)。
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self._entries: Dict[Hashable, Tuple[float, str]] = {}
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """读取未过期的失败结果"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, message = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self.hits += 1
+        return message
+
+    def put(self, key: Hashable, message: str, ttl: float):
+        """记录失败结果，ttl 秒后失效"""
+        if ttl <= 0:
+            return
+        if len(self._entries) >= self.max_entries:
+            self._purge()
+        self._entries[key] = (time.monotonic() + ttl, message)
+
+    def invalidate(self, key: Hashable):
+        """删除某个键（如更新 Cookie 后删除登录失效记录）"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """清空负缓存"""
+        self._entries.clear()
+
+    def _purge(self):
+        """删除过期条目，仍然超出上限时删除最早写入的一半"""
+        now = time.monotonic()
+        self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+        if len(self._entries) >= self.max_entries:
+            keys = list(self._entries)[: len(self._entries) // 2]
+            for key in keys:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        """负缓存统计信息"""
+        return {"hits": self.hits, "entries": len(self._entries)}
+
+
+# 进程内共享的默认缓存
+_default_cache: Optional[LogCache] = None
+_negative_cache: Optional[NegativeCache] = None
+
+
+def get_log_cache() -> LogCache:
+    """获取进程内共享的日志缓存"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LogCache()
+    return _default_cache
+
+
+def get_negative_cache() -> NegativeCache:
+    """获取进程内共享的负缓存"""
+    global _negative_cache
+    if _negative_cache is None:
+        _negative_cache = NegativeCache()
+    return _negative_cache
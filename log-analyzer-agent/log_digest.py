@@ -0,0 +1,278 @@
+"""
+日志摘要
+- 交给模型之前先在本地筛选日志：只保留 ER（可选 WRN）级别的行及其前后 K 行上下文
+- 开头附带各级别的行数统计、保留级别的日志模板（见 log_templates）、已知错误码的说明（见 error_kb）
+  、含 ERROR 的调用链（见 call_chain）和最慢的步骤（见 log_latency），省略的行用一行标记代替
+- 同一条 ERROR/WARN 大量重复时只保留前几次
+- 大部分 INF 行不再进入模型上下文，完整日志可用 mode="raw" 再次获取
+- LogDigester 按批增量处理，digest_log（整段文本）和 log_pipeline（边下载边筛选）共用，
+  同一份日志无论是否命中缓存，摘要都相同
+"""
+
+import os
+import re
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from call_chain import CallChainIndex
+from error_kb import count_error_codes, get_error_kb
+from log_latency import LatencyDetector
+from log_parser import LEVEL_ERROR, LEVEL_INFO, LEVEL_WARN, LogRecord, extract_error_code, parse_lines
+from log_service import TRUNCATED_MARKER
+from log_templates import TemplateMiner
+
+# ============ 配置 ============
+# fetch_error_log 的结果模式
+MODE_ERRORS = "errors"  # 只保留 ER 行及上下文
+MODE_WARNINGS = "warnings"  # 保留 ER、WRN 行及上下文
+MODE_TEMPLATES = "templates"  # 所有级别的日志模板 × 次数
+MODE_RAW = "raw"  # 完整日志
+RESULT_MODES = (MODE_ERRORS, MODE_WARNINGS, MODE_TEMPLATES, MODE_RAW)
+DEFAULT_RESULT_MODE = os.getenv("LOG_RESULT_MODE", MODE_ERRORS)
+
+# 每条保留的日志前后各附带的上下文行数
+DIGEST_CONTEXT_LINES = int(os.getenv("LOG_DIGEST_CONTEXT", "3"))
+# 没有匹配的行时，保留日志末尾的行数
+DIGEST_TAIL_LINES = int(os.getenv("LOG_DIGEST_TAIL", "20"))
+# 摘要开头列出的模板数
+DIGEST_TEMPLATE_LIMIT = int(os.getenv("LOG_DIGEST_TEMPLATES", "10"))
+# 同一条 ERROR/WARN（模块、源文件:行号、错误码相同，内容只差数字）最多保留的次数，0 表示不去重
+DEDUPE_MAX_REPEATS = int(os.getenv("LOG_DEDUPE_MAX_REPEATS", "5"))
+# 去重时最多记录的键数，超出后清空重新计数
+DEDUPE_MAX_KEYS = 10000
+
+MODE_LEVELS = {
+    MODE_ERRORS: (LEVEL_ERROR,),
+    MODE_WARNINGS: (LEVEL_ERROR, LEVEL_WARN),
+}
+# 统计行中各级别的显示顺序
+_LEVEL_ORDER = (LEVEL_ERROR, LEVEL_WARN, LEVEL_INFO)
+_DIGITS = re.compile(r"\d+")
+
+
+def count_levels(records: Iterable[LogRecord]) -> Counter:
+    """按日志级别计数，不符合格式的行记为 "其他" """
+    return Counter(record.level or "其他" for record in records)
+
+
+def format_level_counts(counts: Counter) -> str:
+    """如 "ER 12, WRN 3, INF 4210, 其他 2" """
+    levels = [level for level in _LEVEL_ORDER if level in counts]
+    levels += sorted(level for level in counts if level not in _LEVEL_ORDER)
+    return ", ".join(f"{level} {counts[level]}" for level in levels)
+
+
+def render_selection(lines: Sequence[str], indices: Sequence[int]) -> List[str]:
+    """按下标输出原始行，不连续处插入省略标记"""
+    output = []
+    previous = -1
+    for i in indices:
+        if i > previous + 1:
+            output.append(f"... 省略 {i - previous - 1} 行 ...")
+        output.append(lines[i])
+        previous = i
+    if lines and previous < len(lines) - 1:
+        output.append(f"... 省略 {len(lines) - previous - 1} 行 ...")
+    return output
+
+
+def kb_lines(error_codes: Counter, platform: str) -> List[str]:
+    """已知错误码的 [KB] 说明，error_codes 为 error_kb.count_error_codes 的结果"""
+    kb = get_error_kb()
+    return kb.annotate_counts(error_codes, platform) if kb is not None else []
+
+
+def digest_header(total: int, counts: Counter, levels: Sequence[str], context: int, kept: int) -> str:
+    """摘要的统计行；没有匹配的行时附带说明"""
+    header = (
+        f"[DIGEST] 共 {total} 行（{format_level_counts(counts)}）；"
+        f"保留 {'/'.join(levels)} 行及前后 {context} 行上下文，共 {kept} 行。"
+        f"如需完整日志，请用 mode=\"{MODE_RAW}\" 再次调用 fetch_error_log"
+    )
+    if not any(counts[level] for level in levels):
+        header += f"\n未发现 {'/'.join(levels)} 级别的日志，以下为最后 {DIGEST_TAIL_LINES} 行"
+    return header
+
+
+class LogDigester:
+    """
+    增量生成 errors / warnings 摘要
+
+    按批喂入日志行：累计级别计数、错误码、模板、调用链和步骤耗时，重复的 ERROR/WARN 只保留前
+    max_repeats 次（去重在级别筛选之前，跳过的行不会留下孤立的上下文），输出匹配级别的行及前后 context 行。
+    不是线程安全的：可以放到执行器中运行，但同一时间只能有一个 feed。
+
+    示例:
+        digester = LogDigester(MODE_ERRORS)
+        body = digester.feed(lines) + digester.close()
+        print(digester.render(body))
+    """
+
+    def __init__(
+        self,
+        mode: str = DEFAULT_RESULT_MODE,
+        context: int = DIGEST_CONTEXT_LINES,
+        platform: str = "",
+        max_repeats: int = DEDUPE_MAX_REPEATS,
+    ):
+        self.levels = MODE_LEVELS[mode]
+        self.context = context
+        self.platform = platform
+        self.max_repeats = max_repeats
+        self.lines = 0
+        self.level_counts: Counter = Counter()
+        self.error_codes: Counter = Counter()  # (模块, 错误码) -> 次数
+        self.miner = TemplateMiner()  # 只统计 levels 中的级别
+        self.chains = CallChainIndex()
+        # 调用链随步骤耗时分析按块加入，共用一次分组和时间戳解码
+        self.latency = LatencyDetector(chains=self.chains)
+        self.tail: deque = deque(maxlen=DIGEST_TAIL_LINES)  # (行号, 原始行)
+        self.duplicates = 0
+        self.kept = 0
+        # 全部 ERROR 行的解析结果（去重之前），供规则引擎使用
+        self.errors: List[LogRecord] = []
+        self._seen: Dict[Tuple, int] = {}
+        self._before: deque = deque(maxlen=context)
+        self._after_left = 0
+        self._previous = -1  # 上一个输出行的行号
+
+    @property
+    def matched(self) -> int:
+        return sum(self.level_counts[level] for level in self.levels)
+
+    def feed(self, lines: Sequence[str]) -> List[str]:
+        """加入一批日志行，返回其中要保留的行（不连续处带省略标记）"""
+        levels = self.levels
+        output: List[str] = []
+        for line, record in zip(lines, parse_lines(lines)):
+            index = self.lines
+            self.lines += 1
+            self.level_counts[record.level or "其他"] += 1
+            self.tail.append((index, line))
+            self.latency.add(record, index)
+
+            if record.level in levels:
+                self.miner.add(record)
+                if record.level == LEVEL_ERROR:
+                    count_error_codes((record,), self.error_codes)
+                    self.errors.append(record)
+                if self._is_duplicate(record):
+                    self.duplicates += 1
+                    continue
+                while self._before:
+                    self._emit(*self._before.popleft(), output)
+                self._emit(index, line, output)
+                self._after_left = self.context
+            elif self._after_left > 0:
+                self._emit(index, line, output)
+                self._after_left -= 1
+            elif self.context:
+                self._before.append((index, line))
+        return output
+
+    def _is_duplicate(self, record: LogRecord) -> bool:
+        if not self.max_repeats:
+            return False
+        key = (
+            record.level, record.module, record.src, record.line,
+            extract_error_code(record.message), _DIGITS.sub("#", record.message),
+        )
+        repeats = self._seen.get(key, 0)
+        if repeats >= self.max_repeats:
+            return True
+        if len(self._seen) >= DEDUPE_MAX_KEYS:
+            self._seen.clear()
+        self._seen[key] = repeats + 1
+        return False
+
+    def _emit(self, index: int, line: str, output: List[str]):
+        if index > self._previous + 1:
+            output.append(f"... 省略 {index - self._previous - 1} 行 ...")
+        output.append(line)
+        self.kept += 1
+        self._previous = index
+
+    def close(self) -> List[str]:
+        """日志结束，返回末尾的省略标记（如有）"""
+        self.latency.flush()
+        if self._previous >= 0 and self.lines > self._previous + 1:
+            return [f"... 省略 {self.lines - self._previous - 1} 行 ..."]
+        return []
+
+    def render(self, body: List[str], trailer: Optional[str] = None) -> str:
+        """
+        生成完整摘要：统计行、[KB]、模板、调用链、最慢步骤，随后是 body（feed 和 close 的输出）
+
+        没有匹配的行时 body 换成日志末尾 DIGEST_TAIL_LINES 行；trailer 为下载截断标记。
+        """
+        self.latency.flush()
+        levels = self.levels
+        kept = self.kept
+        if not self.matched:
+            tail = list(self.tail)
+            body = [f"... 省略 {tail[0][0]} 行 ..."] if tail and tail[0][0] else []
+            body.extend(line for _, line in tail)
+            kept = len(tail)
+
+        header = digest_header(self.lines, self.level_counts, levels, self.context, kept)
+        if self.duplicates:
+            header += (
+                f"；另有 {self.duplicates} 行重复的 {'/'.join(levels)} 已合并（每类最多保留 {self.max_repeats} 行）"
+            )
+        output = [header, *kb_lines(self.error_codes, self.platform)]
+        if self.matched:
+            output.append(self.miner.summary(levels, limit=DIGEST_TEMPLATE_LIMIT))
+        for section in (self.chains.summary(), self.latency.summary()):
+            if section:
+                output.append(section)
+        output.extend(body)
+        if trailer is not None:
+            output.append(trailer)
+        return "\n".join(output)
+
+
+def digest_levels(
+    text: str,
+    mode: str = DEFAULT_RESULT_MODE,
+    context: int = DIGEST_CONTEXT_LINES,
+    platform: str = "",
+) -> Tuple[str, List[LogRecord]]:
+    """errors / warnings 模式的 digest_log，同时返回全部 ERROR 行的解析结果（见 LogDigester.errors）"""
+    lines = text.split("\n")
+    trailer = lines.pop() if lines and lines[-1].startswith(TRUNCATED_MARKER) else None
+    digester = LogDigester(mode, context, platform)
+    body = digester.feed(lines) + digester.close()
+    return digester.render(body, trailer), digester.errors
+
+
+def digest_log(
+    text: str,
+    mode: str = DEFAULT_RESULT_MODE,
+    context: int = DIGEST_CONTEXT_LINES,
+    platform: str = "",
+) -> str:
+    """
+    把 fetch_error_log 的原始日志文本压缩成摘要
+
+    开头一行是统计信息，随后是 ER（mode="warnings" 时还有 WRN）的模板、
+    含 ERROR 的调用链摘要、最慢的步骤，以及这些行和前后 context 行（重复的行只保留前几次，见 LogDigester）；
+    没有匹配的行时保留日志末尾 DIGEST_TAIL_LINES 行。
+    mode="templates" 时只输出所有级别的模板。
+    ERROR 行中的错误码在知识库中有记录时（按 platform 查找），附带 [KB] 说明。
+    下载被截断时的 [TRUNCATED] 标记原样保留在末尾。
+    """
+    if mode != MODE_TEMPLATES:
+        return digest_levels(text, mode, context, platform)[0]
+
+    lines = text.split("\n")
+    trailer = lines.pop() if lines and lines[-1].startswith(TRUNCATED_MARKER) else None
+    records = list(parse_lines(lines))
+    header = (
+        f"[DIGEST] 共 {len(lines)} 行（{format_level_counts(count_levels(records))}）。"
+        f"如需原始日志行，请用 mode=\"{MODE_ERRORS}\" 或 mode=\"{MODE_RAW}\" 再次调用 fetch_error_log"
+    )
+    output = [header, *kb_lines(count_error_codes(records), platform), TemplateMiner().add_all(records).summary()]
+    if trailer is not None:
+        output.append(trailer)
+    return "\n".join(output)
+
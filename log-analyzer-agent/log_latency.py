@@ -0,0 +1,257 @@
+"""
+步骤耗时分析
+- 按块交给 call_chain.CallChainIndex：调用链归属和向量化解码的时间戳（log_parser.parse_timestamps）与调用链摘要共用，
+  每行只分组、解码一次
+- 在同一调用链（流水号 × 模块）内计算相邻两行的时间间隔，即每一步的耗时
+- 列出耗时最长的 K 步，并标记疑似超时：间隔达到 LATENCY_TIMEOUT_MS，
+  或间隔达到 LATENCY_SLOW_MS 且后一行提到超时
+- 按块处理，可以逐行流式加入：内存只与块大小和调用链数有关，与日志大小无关
+
+示例:
+    detector = LatencyDetector().add_all(parse_lines(lines))
+    print(detector.summary())
+"""
+
+import os
+import re
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from call_chain import CallChainIndex, format_duration
+from log_parser import LogRecord, parse_lines
+
+# ============ 配置 ============
+# 摘要中列出的最慢步骤数
+LATENCY_TOP_K = int(os.getenv("LOG_LATENCY_TOP_K", "5"))
+# 间隔达到该值视为慢步骤
+LATENCY_SLOW_MS = int(os.getenv("LOG_LATENCY_SLOW_MS", "1000"))
+# 间隔达到该值视为疑似超时
+LATENCY_TIMEOUT_MS = int(os.getenv("LOG_LATENCY_TIMEOUT_MS", "3000"))
+# 每次向量化处理的行数
+LATENCY_BLOCK_ROWS = 4096
+
+_TIMEOUT_PATTERN = re.compile(r"time\s*out|timed out|超时", re.IGNORECASE)
+# 每步附带的日志内容最多字符数
+_MESSAGE_CHARS = 60
+
+class SlowStep:
+    """同一调用链内相邻两行之间的一步及其耗时"""
+
+    __slots__ = ("gap_ms", "from_index", "from_record", "to_index", "to_record", "timeout")
+
+    def __init__(
+        self,
+        gap_ms: int,
+        from_index: int,
+        from_record: LogRecord,
+        to_index: int,
+        to_record: LogRecord,
+        timeout: bool,
+    ):
+        self.gap_ms = gap_ms
+        self.from_index = from_index
+        self.from_record = from_record
+        self.to_index = to_index
+        self.to_record = to_record
+        self.timeout = timeout
+
+    def render(self, number: int) -> str:
+        """
+        如:
+            [SLOW 1] 8.0s 疑似超时 DJC-CF-...-000123 app.order.create 第 120 → 121 行
+              [OrderService.php:88] INF call backend svr=order_svr … → [BaseModule.php:12] ER backend timeout …
+        """
+        before, after = self.from_record, self.to_record
+        flag = " 疑似超时" if self.timeout else ""
+        return (
+            f"[SLOW {number}] {format_duration(self.gap_ms)}{flag} {after.serial} {after.module} "
+            f"第 {self.from_index + 1} → {self.to_index + 1} 行 "
+            f"[{before.location}] {before.level} {_clip(before.message)} → "
+            f"[{after.location}] {after.level} {_clip(after.message)}"
+        )
+
+    def __repr__(self) -> str:
+        return f"SlowStep({self.gap_ms}ms {self.from_record.location} -> {self.to_record.location})"
+
+
+def _clip(message: str) -> str:
+    return message if len(message) <= _MESSAGE_CHARS else message[:_MESSAGE_CHARS] + "…"
+
+
+class LatencyDetector:
+    """
+    流式步骤耗时分析
+
+    chains 为共用的调用链索引：日志只需加入 detector，flush 时按块加入 chains，
+    调用链摘要与步骤耗时共用同一次分组和时间戳解码；不传时使用自己的索引。
+
+    示例:
+        detector = LatencyDetector()
+        for i, record in enumerate(parse_lines(lines)):
+            detector.add(record, i)
+        for step in detector.slowest():
+            ...
+    """
+
+    def __init__(
+        self,
+        top_k: int = LATENCY_TOP_K,
+        slow_ms: int = LATENCY_SLOW_MS,
+        timeout_ms: int = LATENCY_TIMEOUT_MS,
+        chains: Optional[CallChainIndex] = None,
+    ):
+        self.top_k = top_k
+        self.slow_ms = slow_ms
+        self.timeout_ms = timeout_ms
+        self.lines = 0
+        self.timed = 0  # 有时间戳的行数
+        self.steps = 0  # 计算了间隔的步骤数
+        self.slow = 0
+        self.timeouts = 0
+        self.max_gap_ms = 0
+        self.chains = chains if chains is not None else CallChainIndex()
+        # 调用链编号（CallChain.ordinal） -> 已处理的最后一行 (毫秒, 行号, 记录)
+        self._last: Dict[int, Tuple[int, int, LogRecord]] = {}
+        self._block: List[Tuple[int, LogRecord]] = []
+        # 小根堆 (耗时, -序号, 步骤)，只保留最慢的 top_k 个；耗时相同时保留先出现的
+        self._slowest: List[Tuple[int, int, SlowStep]] = []
+        self._timeout_steps: List[Tuple[int, int, SlowStep]] = []
+        self._seq = 0
+
+    def add(self, record: LogRecord, index: Optional[int] = None):
+        """加入一行日志（index 为该行在日志中的行号，默认按加入顺序）；没有流水号的行忽略"""
+        index = self.lines if index is None else index
+        self.lines += 1
+        if not record.serial:
+            return
+        self._block.append((index, record))
+        if len(self._block) >= LATENCY_BLOCK_ROWS:
+            self.flush()
+
+    def add_all(self, records: Iterable[LogRecord]) -> "LatencyDetector":
+        for record in records:
+            self.add(record)
+        self.flush()
+        return self
+
+    def flush(self):
+        """处理缓冲的一块日志"""
+        block, self._block = self._block, []
+        if not block:
+            return
+        # 调用链索引负责分组和时间戳解码；超出 CALL_CHAIN_MAX_CHAINS 的新调用链为 None，编号记为 -1
+        chains, parsed = self.chains.add_block(block)
+        timed = ~np.isnat(parsed)
+        self.timed += int(timed.sum())
+        codes = np.fromiter((-1 if chain is None else chain.ordinal for chain in chains), np.int64, len(chains))
+        rows = np.flatnonzero(timed & (codes >= 0))
+        codes = codes[rows]
+        if not len(rows):
+            return
+        ms = parsed[rows].astype(np.int64)
+
+        # 按调用链稳定排序，同一调用链内保持日志顺序，相邻两行相减即为步骤耗时
+        order = np.argsort(codes, kind="stable")
+        rows, codes, ms = rows[order], codes[order], ms[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        previous = np.empty_like(ms)
+        previous[1:] = ms[:-1]
+        has_previous = ~first
+        # 每条调用链在本块的第一行与上一块的最后一行比较
+        last = self._last
+        for pos in np.flatnonzero(first).tolist():
+            carried = last.get(int(codes[pos]))
+            if carried is not None:
+                previous[pos] = carried[0]
+                has_previous[pos] = True
+        gaps = np.where(has_previous, ms - previous, 0)
+
+        self.steps += int(has_previous.sum())
+        slow = gaps >= self.slow_ms
+        self.slow += int(slow.sum())
+        self.max_gap_ms = max(self.max_gap_ms, int(gaps.max()))
+
+        # 只对慢步骤和本块最慢的 top_k 步逐个处理
+        candidates = set(np.flatnonzero(slow).tolist())
+        if self.top_k:
+            top = np.argpartition(-gaps, min(self.top_k, len(gaps)) - 1)[:self.top_k]
+            candidates.update(pos for pos in top.tolist() if gaps[pos] > 0)
+        for pos in sorted(candidates):
+            self._observe(pos, int(gaps[pos]), block, rows, codes)
+
+        # 记录每条调用链的最后一行，供下一块使用
+        ends = np.ones(len(rows), dtype=bool)
+        ends[:-1] = codes[:-1] != codes[1:]
+        for pos in np.flatnonzero(ends).tolist():
+            index, record = block[rows[pos]]
+            last[int(codes[pos])] = (int(ms[pos]), index, record)
+
+    def _observe(self, pos: int, gap: int, block: List[Tuple[int, LogRecord]], rows: np.ndarray, codes: np.ndarray):
+        to_index, to_record = block[rows[pos]]
+        if pos > 0 and codes[pos - 1] == codes[pos]:
+            from_index, from_record = block[rows[pos - 1]]
+        else:
+            _, from_index, from_record = self._last[int(codes[pos])]
+        timeout = gap >= self.timeout_ms or (gap >= self.slow_ms and bool(_TIMEOUT_PATTERN.search(to_record.message)))
+        if timeout:
+            self.timeouts += 1
+        step = SlowStep(gap, from_index, from_record, to_index, to_record, timeout)
+        self._seq += 1
+        self._push(self._slowest, step)
+        if timeout:
+            self._push(self._timeout_steps, step)
+
+    def _push(self, heap: List[Tuple[int, int, SlowStep]], step: SlowStep):
+        if not self.top_k:
+            return
+        item = (step.gap_ms, -self._seq, step)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+
+    def slowest(self) -> List[SlowStep]:
+        """耗时最长的 top_k 步，按耗时降序"""
+        self.flush()
+        return [step for _, _, step in sorted(self._slowest, key=lambda item: item[:2], reverse=True)]
+
+    def timeout_steps(self) -> List[SlowStep]:
+        """疑似超时中耗时最长的 top_k 步，按耗时降序"""
+        self.flush()
+        return [step for _, _, step in sorted(self._timeout_steps, key=lambda item: item[:2], reverse=True)]
+
+    def summary(self) -> str:
+        """
+        最慢步骤摘要，没有耗时大于 0 的步骤时返回空字符串:
+            [LATENCY] 4085 行中 4085 行有时间戳，共 120 条调用链、3965 个步骤间隔；最长 8.0s，≥1.0s 的慢步骤 12 个，疑似超时 3 个
+            [SLOW 1] 8.0s 疑似超时 DJC-CF-...-000123 app.order.create 第 120 → 121 行 [...] … → [...] …
+        """
+        slowest = self.slowest()
+        if not slowest:
+            return ""
+        # 慢步骤之外的疑似超时（如提到超时但耗时不在前 top_k 的）也列出
+        listed = set(map(id, slowest))
+        steps = slowest + [step for step in self.timeout_steps() if id(step) not in listed]
+        lines = [
+            f"[LATENCY] {self.lines} 行中 {self.timed} 行有时间戳，共 {len(self.chains.chains)} 条调用链、"
+            f"{self.steps} 个步骤间隔；最长 {format_duration(self.max_gap_ms)}，"
+            f"≥{format_duration(self.slow_ms)} 的慢步骤 {self.slow} 个，疑似超时 {self.timeouts} 个"
+            f"（间隔 ≥{format_duration(self.timeout_ms)}，或慢步骤后提到超时）"
+        ]
+        lines.extend(step.render(number) for number, step in enumerate(steps, 1))
+        return "\n".join(lines)
+
+
+def analyze_latency(text: str, top_k: int = LATENCY_TOP_K) -> str:
+    """对 fetch_error_log 返回的完整日志文本做步骤耗时分析，返回摘要文本"""
+    detector = LatencyDetector(top_k=top_k).add_all(parse_lines(text.split("\n")))
+    summary = detector.summary()
+    if summary:
+        return summary
+    return (
+        f"[LATENCY] 共 {detector.lines} 行，其中 {detector.timed} 行有时间戳，没有耗时大于 0 的步骤间隔"
+        f"（同一流水号和模块内至少需要两行时间不同的日志）"
+    )
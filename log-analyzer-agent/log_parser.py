@@ -0,0 +1,200 @@
+"""
+DJC 日志行解析
+- 日志格式: [F:IP|QQ:QQ号]日期 时间|级别||[源文件:行号][流水号][模块名][OPENID:]内容
+- 单个预编译正则、单次扫描，每行解析为一个紧凑的 LogRecord（__slots__）
+- 重复率高的字段（IP、QQ、级别、源文件、流水号、模块、OPENID）会做字符串驻留，
+  同一份日志中相同的值只保留一个对象
+- 后续的过滤、索引、统计都基于 LogRecord
+- 时间戳按块用 numpy 向量化解码（parse_timestamps），调用链和步骤耗时共用
+"""
+
+import re
+import sys
+from typing import Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+# 日志级别
+LEVEL_INFO = "INF"
+LEVEL_WARN = "WRN"
+LEVEL_ERROR = "ER"
+
+_LINE_PATTERN = re.compile(
+    r"\[F:(?P<ip>[^|\]]*)\|QQ:(?P<qq>[^\]]*)\]"
+    r"(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:[.,]\d+)?)\|"
+    r"(?P<level>[A-Z]*)\|\|"
+    r"\[(?P<src>[^\]]*?):(?P<line>\d+)\]"
+    r"\[(?P<serial>[^\]]*)\]"
+    r"\[(?P<module>[^\]]*)\]"
+    r"\[OPENID:(?P<openid>[^\]]*)\]"
+    r"(?P<message>.*)",
+    re.DOTALL
+)
+
+_intern = sys.intern
+
+_CODE_PATTERN = re.compile(r"\b(?:ret|code|errcode|iRet)\s*[=:]\s*(-?\d+)")
+_MSG_PATTERN = re.compile(r"\bmsg\s*[=:]\s*([^\s,;]+)")
+
+
+class LogRecord:
+    """一行结构化日志"""
+
+    __slots__ = ("ip", "qq", "timestamp", "level", "src", "line", "serial", "module", "openid", "message")
+
+    def __init__(
+        self,
+        ip: str,
+        qq: str,
+        timestamp: str,
+        level: str,
+        src: str,
+        line: int,
+        serial: str,
+        module: str,
+        openid: str,
+        message: str,
+    ):
+        self.ip = ip
+        self.qq = qq
+        self.timestamp = timestamp
+        self.level = level
+        self.src = src
+        self.line = line
+        self.serial = serial
+        self.module = module
+        self.openid = openid
+        self.message = message
+
+    @classmethod
+    def unparsed(cls, text: str) -> "LogRecord":
+        """不符合日志格式的行（如 jsonHeader），整行作为 message 保留"""
+        return cls("", "", "", "", "", 0, "", "", "", text)
+
+    @property
+    def is_parsed(self) -> bool:
+        """是否为符合格式的日志行"""
+        return bool(self.timestamp)
+
+    @property
+    def location(self) -> str:
+        """源文件:行号"""
+        return f"{self.src}:{self.line}"
+
+    def format(self) -> str:
+        """还原为原始日志格式"""
+        if not self.is_parsed:
+            return self.message
+        return (
+            f"[F:{self.ip}|QQ:{self.qq}]{self.timestamp}|{self.level}||"
+            f"[{self.src}:{self.line}][{self.serial}][{self.module}][OPENID:{self.openid}]{self.message}"
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"LogRecord({self.timestamp} {self.level} [{self.module}] {self.location} {self.message[:60]!r})"
+
+
+def parse_line(text: str) -> Optional[LogRecord]:
+    """解析一行日志，不符合格式时返回 None"""
+    match = _LINE_PATTERN.match(text)
+    if match is None:
+        return None
+    ip, qq, timestamp, level, src, line, serial, module, openid, message = match.groups()
+    return LogRecord(
+        _intern(ip), _intern(qq), timestamp, _intern(level), _intern(src), int(line),
+        _intern(serial), _intern(module), _intern(openid), message
+    )
+
+
+def parse_lines(lines: Iterable[str], keep_unparsed: bool = True) -> Iterator[LogRecord]:
+    """
+    逐行解析日志
+
+    keep_unparsed=True 时，不符合格式的行以 LogRecord.unparsed() 的形式保留，
+    保证输出与输入一一对应；否则直接跳过。
+    """
+    match = _LINE_PATTERN.match
+    intern = _intern
+    for text in lines:
+        m = match(text)
+        if m is not None:
+            ip, qq, timestamp, level, src, line, serial, module, openid, message = m.groups()
+            yield LogRecord(
+                intern(ip), intern(qq), timestamp, intern(level), intern(src), int(line),
+                intern(serial), intern(module), intern(openid), message
+            )
+        elif keep_unparsed:
+            yield LogRecord.unparsed(text)
+
+
+def extract_error_code(message: str) -> str:
+    """从日志内容中提取错误码，如 "ret=-6712" -> "-6712"，没有时返回空字符串"""
+    match = _CODE_PATTERN.search(message)
+    return match.group(1) if match else ""
+
+
+def extract_error_message(message: str) -> str:
+    """从日志内容中提取错误信息，如 "msg=系统繁忙，请稍后再试" -> "系统繁忙，请稍后再试" """
+    match = _MSG_PATTERN.search(message)
+    return match.group(1) if match else ""
+
+
+# "2025-12-18 10:00:01,250" 共 23 个字符，更长的小数部分截断为毫秒
+_TIMESTAMP_WIDTH = 23
+_DIGIT_COLUMNS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+
+def parse_timestamps(values: Sequence[str]) -> np.ndarray:
+    """
+    向量化解码 "YYYY-MM-DD HH:MM:SS[,mmm]" 格式的时间戳，返回 datetime64[ms] 数组
+
+    无法解析的值（如不符合格式的行的空时间戳）为 NaT。
+    """
+    count = len(values)
+    if not count:
+        return np.empty(0, dtype="datetime64[ms]")
+    try:
+        raw = np.array(values, dtype=f"S{_TIMESTAMP_WIDTH}")
+    except UnicodeEncodeError:
+        raw = np.array([value.encode("ascii", "replace") for value in values], dtype=f"S{_TIMESTAMP_WIDTH}")
+    chars = raw.view(np.uint8).reshape(count, _TIMESTAMP_WIDTH)
+    # uint8 减法会回绕，非数字字符都大于 9
+    digits = chars - np.uint8(ord("0"))
+    is_digit = digits <= 9
+
+    valid = is_digit[:, _DIGIT_COLUMNS].all(axis=1)
+    valid &= (chars[:, 4] == ord("-")) & (chars[:, 7] == ord("-"))
+    valid &= (chars[:, 10] == ord(" ")) | (chars[:, 10] == ord("T"))
+    valid &= (chars[:, 13] == ord(":")) & (chars[:, 16] == ord(":"))
+
+    def number(start: int, width: int) -> np.ndarray:
+        value = np.zeros(count, dtype=np.int64)
+        for col in range(start, start + width):
+            value = value * 10 + digits[:, col]
+        return value
+
+    year, month, day = number(0, 4), number(5, 2), number(8, 2)
+    hour, minute, second = number(11, 2), number(14, 2), number(17, 2)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    valid &= (hour < 24) & (minute < 60) & (second < 61)
+
+    # 逗号或点之后最多取 3 位，遇到非数字停止
+    millis = np.zeros(count, dtype=np.int64)
+    has_fraction = (chars[:, 19] == ord(",")) | (chars[:, 19] == ord("."))
+    for col, scale in ((20, 100), (21, 10), (22, 1)):
+        has_fraction &= is_digit[:, col]
+        millis += np.where(has_fraction, digits[:, col].astype(np.int64) * scale, 0)
+
+    # 公历日期 -> 1970-01-01 起的天数（days_from_civil 算法）
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+    result = ((((days * 24 + hour) * 60 + minute) * 60 + second) * 1000 + millis).astype("datetime64[ms]")
+    result[~valid] = np.datetime64("NaT")
+    return result
@@ -0,0 +1,220 @@
+"""
+流式日志处理管道
+- 每个阶段都是异步生成器，按需从上一阶段拉取：
+  下载分块 -> 解码 result 条目 -> 日志行 -> 下载预算 -> 分批 -> 摘要（log_digest.LogDigester：解析、统计、去重、级别过滤、格式化）
+- 摘要阶段按批在执行器中运行，解析、模板、调用链、耗时统计不占用事件循环；分析一批的同时继续下载下一批
+- 与 log_digest.digest_log 共用同一个 LogDigester，命中缓存与否摘要相同
+- 不保存完整日志：内存只与上下文行数、模板数、去重键数、调用链数有关，与日志大小无关
+- 第一条 ERROR 在下载完成之前就会产出
+
+示例:
+    digester = LogDigester(MODE_ERRORS)
+    async for line in stream_error_log(event_id, digester, executor=executor):
+        print(line)
+    print(digester.level_counts, digester.duplicates)
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+from log_digest import DIGEST_CONTEXT_LINES, LogDigester
+from log_parser import LogRecord
+from log_service import (
+    ERROR_LEVEL_MARKER,
+    LOG_NOT_FOUND_ERROR,
+    LogBudget,
+    LogResultStreamParser,
+    LogServiceClient,
+    format_log_item,
+    get_log_client,
+    stream_has_more,
+    truncated_marker,
+)
+
+# ============ 配置 ============
+# 边下载边筛选时，完整日志不超过该字节数才保留下来写入缓存
+PIPELINE_CACHE_MAX_BYTES = int(os.getenv("LOG_PIPELINE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# 每批交给执行器分析的日志行数
+PIPELINE_BATCH_LINES = int(os.getenv("LOG_PIPELINE_BATCH_LINES", "2000"))
+
+
+class PipelineStats:
+    """管道运行过程中累计的下载统计；日志内容的统计在 LogDigester 中"""
+
+    def __init__(self, keep_raw_bytes: int = 0):
+        self.lines = 0
+        self.error_lines = 0
+        self.bytes_read = 0
+        self.stop_reason = ""
+        self.truncated = False
+        # 完整日志行，超出 keep_raw_bytes 后丢弃（None）
+        self.keep_raw_bytes = keep_raw_bytes
+        self.raw_lines: Optional[List[str]] = [] if keep_raw_bytes > 0 else None
+        self._raw_bytes = 0
+
+    def keep_raw(self, line: str):
+        if self.raw_lines is None:
+            return
+        self._raw_bytes += len(line) + 1
+        if self._raw_bytes > self.keep_raw_bytes:
+            self.raw_lines = None
+        else:
+            self.raw_lines.append(line)
+
+
+# ============ 管道阶段 ============
+async def fetch_lines(
+    event_id: str,
+    client: Optional[LogServiceClient] = None,
+    parser: Optional[LogResultStreamParser] = None,
+) -> AsyncIterator[str]:
+    """下载分块、解码 result 条目，逐行产出日志文本（content 或 jsonHeader）"""
+    client = client or get_log_client()
+    stream = client.stream_items(event_id, parser=parser)
+    try:
+        async for item in stream:
+            line = format_log_item(item)
+            if line is not None:
+                yield line
+    finally:
+        # 下游提前停止时关闭流，连接随之关闭
+        await stream.aclose()
+
+
+async def limit_budget(
+    lines: AsyncIterator[str],
+    budget: LogBudget,
+    parser: LogResultStreamParser,
+    stats: PipelineStats,
+) -> AsyncIterator[str]:
+    """
+    超出下载预算时停止拉取（规则同 log_service.fetch_bounded_log），原因记录在 stats.stop_reason；
+    之后确实还有未读取的日志时 stats.truncated 为 True
+    """
+    context_left = -1
+    async for line in lines:
+        stats.lines += 1
+        if ERROR_LEVEL_MARKER in line:
+            stats.error_lines += 1
+            if budget.max_errors and stats.error_lines == budget.max_errors:
+                context_left = budget.error_context
+        stats.keep_raw(line)
+        yield line
+
+        if budget.max_bytes and parser.bytes_fed >= budget.max_bytes:
+            stats.stop_reason = f"超出下载字节上限 {budget.max_bytes}"
+        elif budget.max_lines and stats.lines >= budget.max_lines:
+            stats.stop_reason = f"超出行数上限 {budget.max_lines}"
+        elif context_left == 0:
+            stats.stop_reason = f"已收集 {budget.max_errors} 条 ERROR 及其上下文"
+        if stats.stop_reason:
+            # 日志正好在预算处结束时不算截断
+            stats.truncated = await stream_has_more(lines)
+            return
+        if context_left > 0:
+            context_left -= 1
+
+
+async def batch_lines(lines: AsyncIterator[str], size: int = PIPELINE_BATCH_LINES) -> AsyncIterator[List[str]]:
+    """每 size 行产出一批，最后一批可能不足 size 行"""
+    batch: List[str] = []
+    async for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def digest_batches(
+    batches: AsyncIterator[List[str]],
+    digester: LogDigester,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[str]:
+    """
+    把每批日志交给执行器中的 digester，产出要保留的行；结束时产出末尾的省略标记
+
+    分析一批的同时从上游拉取下一批；同一时间只有一批在分析，digester 不需要加锁。
+    """
+    loop = asyncio.get_running_loop()
+    pending = None
+    async for batch in batches:
+        if pending is not None:
+            for kept in await pending:
+                yield kept
+        pending = loop.run_in_executor(executor, digester.feed, batch)
+    if pending is not None:
+        for kept in await pending:
+            yield kept
+    for kept in await loop.run_in_executor(executor, digester.close):
+        yield kept
+
+
+# ============ 组合 ============
+async def stream_error_log(
+    event_id: str,
+    digester: LogDigester,
+    budget: Optional[LogBudget] = None,
+    stats: Optional[PipelineStats] = None,
+    client: Optional[LogServiceClient] = None,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[str]:
+    """
+    边下载边筛选，逐行产出 digester 级别的日志及其上下文
+
+    digester 在 executor 中运行（None 表示事件循环的默认线程池）。digester 有状态，
+    传入进程池时改用默认线程池。
+    结束后 digester 中有完整的统计（各级别计数、模板、错误码、调用链），stats 中有下载统计（是否截断）。
+    """
+    if isinstance(executor, ProcessPoolExecutor):
+        executor = None
+    stats = stats or PipelineStats()
+    parser = LogResultStreamParser()
+    lines = fetch_lines(event_id, client, parser)
+    limited = limit_budget(lines, budget or LogBudget(), parser, stats)
+    batches = batch_lines(limited)
+    output = digest_batches(batches, digester, executor)
+    try:
+        async for line in output:
+            yield line
+    finally:
+        # 从下游往上游依次关闭，下载流在 fetch_lines 中关闭
+        for stage in (output, batches, limited, lines):
+            await stage.aclose()
+        stats.bytes_read = parser.bytes_fed
+
+
+async def fetch_digest(
+    event_id: str,
+    mode: str,
+    context: int = DIGEST_CONTEXT_LINES,
+    budget: Optional[LogBudget] = None,
+    platform: str = "",
+    client: Optional[LogServiceClient] = None,
+    keep_raw_bytes: int = PIPELINE_CACHE_MAX_BYTES,
+    executor: Optional[Executor] = None,
+) -> Tuple[str, Optional[str], List[LogRecord]]:
+    """
+    通过管道生成与 log_digest.digest_log 相同的摘要，分析和生成摘要都在 executor 中进行
+
+    返回 (摘要, 完整日志, 全部 ERROR 行的解析结果)；完整日志超过 keep_raw_bytes 或被截断时不返回（不写入缓存），为 None。
+    日志为空时返回 LOG_NOT_FOUND_ERROR。下载失败的异常直接抛出。
+    """
+    digester = LogDigester(mode, context, platform)
+    stats = PipelineStats(keep_raw_bytes)
+    if isinstance(executor, ProcessPoolExecutor):
+        executor = None
+    body = [line async for line in stream_error_log(event_id, digester, budget, stats, client, executor)]
+    if not digester.lines:
+        return LOG_NOT_FOUND_ERROR, None, []
+
+    raw = stats.raw_lines
+    marker = None
+    if stats.truncated:
+        marker = truncated_marker(stats.stop_reason, stats.bytes_read, stats.lines, stats.error_lines)
+        raw = None
+    digest = await asyncio.get_running_loop().run_in_executor(executor, digester.render, body, marker)
+    return digest, ("\n".join(raw) if raw is not None else None), digester.errors
@@ -0,0 +1,735 @@
+"""
+日志服务客户端
+- 构建 curl2.php 请求参数
+- 长期存活的会话：共享的 HTTP 连接池（keep-alive）和 Cookie，并发 analyze() 可重叠网络等待
+- 解析 var log_result= 响应（整体解析或按块流式解析）
+
+main.py、test_fetch.py 等所有访问 curl2.php 的代码都应通过 get_log_client() 获取同一个会话。
+"""
+
+import os
+import json
+import codecs
+import asyncio
+import threading
+from http.cookies import CookieError, SimpleCookie
+from concurrent.futures import Executor
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+import json_codec
+from log_cache import AUTH_FAILURE_KEY, get_negative_cache
+from resilience import RetryPolicy, get_breaker, get_rate_limiter, is_retryable
+
+load_dotenv()
+
+# ============ 配置 ============
+LOG_SERVICE_URL = os.getenv("LOG_SERVICE_URL", "http://help.ied.com/logplat/curl2.php")
+LOG_REFERER = "http://help.ied.com/helpv2/html/showInfo_v2.html"
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"
+
+# 认证 Cookie（从浏览器复制）
+# 在浏览器登录后，F12 -> Network -> 找到 curl2.php 请求 -> 复制 Cookie
+AUTH_COOKIE = os.getenv("LOG_SERVICE_COOKIE", "")
+
+# 连接池与超时（秒），可通过环境变量调整
+MAX_CONNECTIONS = int(os.getenv("LOG_SERVICE_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LOG_SERVICE_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("LOG_SERVICE_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("LOG_SERVICE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LOG_SERVICE_READ_TIMEOUT", "30"))
+POOL_TIMEOUT = float(os.getenv("LOG_SERVICE_POOL_TIMEOUT", "10"))
+
+# 响应超过该长度（字符）时，解析放到执行器中进行
+PARSE_OFFLOAD_THRESHOLD = int(os.getenv("LOG_PARSE_OFFLOAD_THRESHOLD", str(256 * 1024)))
+
+LOG_RESULT_PREFIX = "var log_result="
+LOGIN_MARKERS = ("未找到登录", "urlJump")
+# 登录跳转页很小，只需检查响应开头的这些字节
+LOGIN_SNIFF_BYTES = 4096
+
+# 交给模型的错误文本前缀，fetch_error_log 据此识别需要负缓存的结果
+LOGIN_REQUIRED_ERROR = "[ERROR] 需要登录认证。请在 .env 文件中设置 LOG_SERVICE_COOKIE"
+LOG_NOT_FOUND_ERROR = "[ERROR] 未找到该 EventID 的日志"
+
+# 流式读取时每次读取的字节数
+STREAM_CHUNK_SIZE = int(os.getenv("LOG_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+
+# 下载预算：达到任一上限即停止读取并关闭连接，0 表示不限制
+FETCH_MAX_BYTES = int(os.getenv("LOG_FETCH_MAX_BYTES", str(16 * 1024 * 1024)))
+FETCH_MAX_LINES = int(os.getenv("LOG_FETCH_MAX_LINES", "50000"))
+# 收集到这么多条 ERROR 并再读取 FETCH_ERROR_CONTEXT 行上下文后提前停止
+FETCH_MAX_ERRORS = int(os.getenv("LOG_FETCH_MAX_ERRORS", "200"))
+FETCH_ERROR_CONTEXT = int(os.getenv("LOG_FETCH_ERROR_CONTEXT", "50"))
+
+# 下载被截断时日志文本最后一行的前缀
+TRUNCATED_MARKER = "[TRUNCATED]"
+
+# DJC 日志格式中 ERROR 级别的标记：日期 时间|ER||[源文件:行号]...
+ERROR_LEVEL_MARKER = "|ER||"
+
+
+class LogServiceError(Exception):
+    """日志服务返回了无法解析的响应"""
+
+
+class LoginRequiredError(LogServiceError):
+    """日志服务要求登录（Cookie 缺失或过期）"""
+
+
+# ============ 请求构建 ============
+def parse_plat_name(event_id: str) -> str:
+    """解析平台名（取第一个 - 之前的部分）"""
+    return event_id.split("-")[0] if "-" in event_id else "AMS"
+
+
+def build_params(event_id: str) -> dict:
+    """构建 curl2.php 请求参数"""
+    plat_name = parse_plat_name(event_id)
+    return {
+        "url": f"plat_name={plat_name}&serial_num={event_id}&source_charset=utf8",
+        "set": "",
+        "referer": LOG_REFERER
+    }
+
+
+def build_headers(cookie: str = "") -> dict:
+    """构建请求头（含认证 Cookie）"""
+    headers = {
+        "User-Agent": USER_AGENT,
+        "Referer": LOG_REFERER
+    }
+    if cookie:
+        headers["Cookie"] = cookie
+    return headers
+
+
+def parse_cookie_header(cookie: str) -> Dict[str, str]:
+    """解析浏览器复制出来的 Cookie 请求头（"a=1; b=2"）"""
+    cookies = {}
+    for part in cookie.split(";"):
+        name, sep, value = part.strip().partition("=")
+        if sep and name:
+            cookies[name] = value
+    return cookies
+
+
+# ============ 响应解析 ============
+def format_log_item(item: dict) -> Optional[str]:
+    """将 result[] 中的一项转换为一行日志文本，无法识别时返回 None"""
+    if "content" in item:
+        return item["content"]
+    if "jsonHeader" in item:
+        return json_codec.dumps(item)
+    return None
+
+
+def is_login_required(head: Union[str, bytes]) -> bool:
+    """响应开头是否包含登录跳转标记"""
+    if isinstance(head, bytes):
+        return any(marker.encode("utf-8") in head for marker in LOGIN_MARKERS)
+    return any(marker in head for marker in LOGIN_MARKERS)
+
+
+def parse_log_response(content: Union[str, bytes]) -> str:
+    """
+    将 curl2.php 的响应转换为交给模型的日志文本
+
+    推荐直接传入响应字节（response.content）：请求已指定 source_charset=utf8，
+    字节直接交给 JSON 解码器（见 json_codec），避免 HTTP 库在缺少 charset 时
+    对整个响应做编码探测。
+    """
+    # 检查是否需要登录（只看响应开头）
+    if is_login_required(content[:LOGIN_SNIFF_BYTES]):
+        head = content[:LOGIN_SNIFF_BYTES]
+        if isinstance(head, bytes):
+            head = head.decode("utf-8", errors="replace")
+        return f"{LOGIN_REQUIRED_ERROR}\n原始响应: {head[:500]}"
+
+    prefix = LOG_RESULT_PREFIX.encode("utf-8") if isinstance(content, bytes) else LOG_RESULT_PREFIX
+
+    # 解析返回的 JavaScript 变量 (var log_result={...})
+    if content.startswith(prefix):
+        try:
+            # 从前缀之后直接解码，不再复制一份去掉前缀的数据
+            log_data = json_codec.loads(content, offset=len(prefix))
+            # 提取实际日志内容
+            if "result" in log_data and isinstance(log_data["result"], list):
+                logs = [line for line in map(format_log_item, log_data["result"]) if line is not None]
+                if not logs:
+                    return f"{LOG_NOT_FOUND_ERROR}\n原始响应: {json_codec.dumps(log_data, indent=True)}"
+                return "\n".join(logs)
+            return json_codec.dumps(log_data, indent=True)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            pass
+
+    if isinstance(content, bytes):
+        return content.decode("utf-8", errors="replace")
+    return content
+
+
+async def parse_log_response_async(content: Union[str, bytes], executor: Optional[Executor] = None) -> str:
+    """
+    异步版本的 parse_log_response
+
+    小响应直接在事件循环上解析；大响应交给执行器（线程池/进程池），
+    避免 json.loads 和字符串拼接长时间占用事件循环。
+    """
+    if len(content) < PARSE_OFFLOAD_THRESHOLD:
+        return parse_log_response(content)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, parse_log_response, content)
+
+
+class LogResultStreamParser:
+    """
+    var log_result={...} 的增量解析器
+
+    按块喂入响应字节，每次返回新解析出的 result[] 元素。
+    - 跳过 JS 前缀时只比较、不复制整个响应
+    - 只缓冲尚未解析完的那一个元素，峰值内存与响应大小无关
+    - result 之外的顶层字段（ret、msg 等）保存在 header 中
+
+    示例:
+        parser = LogResultStreamParser()
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                ...
+        parser.close()
+    """
+
+    # 解析状态
+    _PREFIX, _OBJECT, _KEY, _COLON, _VALUE, _ARRAY, _DONE = range(7)
+    _WHITESPACE = " \t\r\n"
+
+    def __init__(self):
+        self.header: dict = {}
+        self.items_parsed = 0
+        self.bytes_fed = 0
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = self._PREFIX
+        self._key: Optional[str] = None
+        self._eof = False
+
+    @property
+    def done(self) -> bool:
+        """顶层对象是否已解析完毕"""
+        return self._state == self._DONE
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        """喂入一块响应字节，返回本次解析出的 result[] 元素"""
+        self.bytes_fed += len(chunk)
+        text = self._utf8.decode(chunk)
+        if self._pos:
+            # 丢弃已解析部分，保持缓冲区只包含未完成的数据
+            self._buf = self._buf[self._pos:] + text
+            self._pos = 0
+        else:
+            self._buf += text
+        return self._parse()
+
+    def close(self) -> List[dict]:
+        """响应读取完毕，解析剩余数据；结构不完整时抛出 LogServiceError"""
+        self._buf = self._buf[self._pos:] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        items = self._parse()
+        if self._state != self._DONE:
+            raise LogServiceError(f"log_result 响应不完整或格式错误: {self._buf[:200]}")
+        return items
+
+    def _skip_whitespace(self, extra: str = "") -> bool:
+        """跳过空白（及 extra 中的字符），缓冲区耗尽时返回 False"""
+        buf, pos, skip = self._buf, self._pos, self._WHITESPACE + extra
+        while pos < len(buf) and buf[pos] in skip:
+            pos += 1
+        self._pos = pos
+        return pos < len(buf)
+
+    def _decode_value(self):
+        """从当前位置解码一个 JSON 值，数据不足时返回 (False, None)"""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise LogServiceError(f"log_result 响应格式错误: {self._buf[self._pos:self._pos + 200]}")
+            return False, None
+        # 数字等标量可能被块边界截断，必须看到其后的字符才能确认完整
+        if end == len(self._buf) and not self._eof:
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _parse(self) -> List[dict]:
+        items = []
+        while True:
+            state = self._state
+            if state == self._PREFIX:
+                if len(self._buf) < len(LOG_RESULT_PREFIX) and not self._eof:
+                    return items
+                if not self._buf.startswith(LOG_RESULT_PREFIX):
+                    raise LogServiceError(f"响应不是 log_result 格式: {self._buf[:200]}")
+                self._pos = len(LOG_RESULT_PREFIX)
+                self._state = self._OBJECT
+            elif state == self._DONE:
+                return items
+            elif not self._skip_whitespace("," if state in (self._KEY, self._ARRAY) else ""):
+                return items
+            elif state == self._OBJECT:
+                if self._buf[self._pos] != "{":
+                    raise LogServiceError(f"log_result 不是 JSON 对象: {self._buf[self._pos:self._pos + 200]}")
+                self._pos += 1
+                self._state = self._KEY
+            elif state == self._KEY:
+                if self._buf[self._pos] == "}":
+                    self._pos += 1
+                    self._state = self._DONE
+                    continue
+                ok, key = self._decode_value()
+                if not ok:
+                    return items
+                self._key = key
+                self._state = self._COLON
+            elif state == self._COLON:
+                if self._buf[self._pos] != ":":
+                    raise LogServiceError(f"log_result 格式错误: {self._buf[self._pos:self._pos + 200]}")
+                self._pos += 1
+                self._state = self._VALUE
+            elif state == self._VALUE:
+                if self._key == "result" and self._buf[self._pos] == "[":
+                    self._pos += 1
+                    self._state = self._ARRAY
+                    continue
+                ok, value = self._decode_value()
+                if not ok:
+                    return items
+                self.header[self._key] = value
+                self._state = self._KEY
+            elif state == self._ARRAY:
+                if self._buf[self._pos] == "]":
+                    self._pos += 1
+                    self._state = self._KEY
+                    continue
+                ok, item = self._decode_value()
+                if not ok:
+                    return items
+                self.items_parsed += 1
+                items.append(item)
+
+
+# ============ 异步连接池 ============
+class LogServiceClient:
+    """
+    日志服务会话
+
+    - 持有长期存活的 httpx.AsyncClient（以及按需创建的同步 httpx.Client），
+      所有请求共享 keep-alive 连接池，TLS/TCP 建连只发生一次
+    - 持有 Cookie：初始值来自 LOG_SERVICE_COOKIE，响应中的 Set-Cookie 会自动合并，
+      也可通过 set_cookie() / reload_credentials() 在运行中热更新凭据，无需重启
+    httpx 的异步连接池绑定在创建它的事件循环上，若检测到事件循环变化（如多次 asyncio.run），
+    会自动重建连接池。
+    """
+
+    def __init__(
+        self,
+        base_url: str = LOG_SERVICE_URL,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        pool_timeout: float = POOL_TIMEOUT,
+        retry_policy: Optional[RetryPolicy] = None,
+        cookie: str = AUTH_COOKIE,
+    ):
+        self.base_url = base_url
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            read_timeout,
+            connect=connect_timeout,
+            pool=pool_timeout
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._cookies: Dict[str, str] = parse_cookie_header(cookie)
+        self._cookie_lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """获取当前事件循环下的共享 AsyncClient"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # 与 requests 一致跟随重定向：登录失效时日志服务会 30x 到登录页，需要读到登录页内容才能识别
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+            self._loop = loop
+        return self._client
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """获取共享的同步 Client（供 test_fetch.py 等同步脚本使用）"""
+        if self._sync_client is None or self._sync_client.is_closed:
+            self._sync_client = httpx.Client(limits=self.limits, timeout=self.timeout, follow_redirects=True)
+        return self._sync_client
+
+    # ---------- Cookie ----------
+    @property
+    def has_cookie(self) -> bool:
+        """是否持有认证 Cookie"""
+        return bool(self._cookies)
+
+    def cookie_header(self) -> str:
+        """当前 Cookie 请求头"""
+        with self._cookie_lock:
+            return "; ".join(f"{name}={value}" for name, value in self._cookies.items())
+
+    def set_cookie(self, cookie: str):
+        """
+        热更新认证 Cookie（完整替换）
+
+        同时清除"需要登录"的负缓存，下一次请求立即使用新凭据。
+        """
+        with self._cookie_lock:
+            self._cookies = parse_cookie_header(cookie)
+        get_negative_cache().invalidate(AUTH_FAILURE_KEY)
+
+    def reload_credentials(self, env_file: Optional[str] = None):
+        """重新读取 .env 中的 LOG_SERVICE_COOKIE 并热更新"""
+        load_dotenv(env_file, override=True)
+        self.set_cookie(os.getenv("LOG_SERVICE_COOKIE", ""))
+
+    def _absorb_set_cookie(self, response: httpx.Response):
+        """合并响应中的 Set-Cookie（服务端续期的会话 Cookie）"""
+        set_cookies = response.headers.get_list("set-cookie")
+        if not set_cookies:
+            return
+        with self._cookie_lock:
+            for header in set_cookies:
+                try:
+                    parsed = SimpleCookie(header)
+                except CookieError:
+                    continue
+                for name, morsel in parsed.items():
+                    if morsel["max-age"] == "0" or morsel.value in ("", "deleted"):
+                        self._cookies.pop(name, None)
+                    else:
+                        self._cookies[name] = morsel.value
+
+    def request_kwargs(self, event_id: str) -> dict:
+        """请求 event_id 时传给 httpx 的 params/headers（含当前 Cookie）"""
+        return {
+            "params": build_params(event_id),
+            "headers": build_headers(self.cookie_header()),
+        }
+
+    # ---------- 请求 ----------
+    def get_sync(self, event_id: str) -> httpx.Response:
+        """
+        同步请求指定 EventID 的日志（不抛出 HTTP 状态错误，不经过异步限流）
+
+        供 test_fetch.py 等同步调试脚本使用，与异步请求共享 Cookie。
+        """
+        response = self.sync_client.get(self.base_url, **self.request_kwargs(event_id))
+        self._absorb_set_cookie(response)
+        return response
+
+    async def get(self, event_id: str) -> httpx.Response:
+        """
+        请求指定 EventID 的日志
+
+        连接错误、超时和 5xx 按 retry_policy 退避重试；
+        所属平台的熔断器打开时直接抛出 CircuitOpenError。
+        """
+        breaker = get_breaker(parse_plat_name(event_id))
+        breaker.before_call()
+        try:
+            response = await self.retry_policy.run(lambda: self._get_once(event_id))
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return response
+
+    async def _get_once(self, event_id: str) -> httpx.Response:
+        """发出一次请求（先按平台限流），非 2xx 响应抛出 HTTPStatusError"""
+        await get_rate_limiter(parse_plat_name(event_id)).acquire()
+        response = await self.client.get(self.base_url, **self.request_kwargs(event_id))
+        self._absorb_set_cookie(response)
+        response.raise_for_status()
+        return response
+
+    async def stream_items(
+        self,
+        event_id: str,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        parser: Optional[LogResultStreamParser] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        流式获取日志，逐个产出 result[] 元素
+
+        按块读取响应体并增量解析，不在内存中保留完整响应。
+        可传入自己的 parser 以读取 header、已读字节数等进度信息。
+        调用方提前停止迭代时，连接会被直接关闭，剩余响应不再下载；
+        此时已收到 2xx 响应，熔断器按成功计（超出下载预算提前停止是常态）。
+        需要登录时抛出 LoginRequiredError，响应格式错误时抛出 LogServiceError。
+        建立连接、等待响应头时的连接错误、超时和 5xx 与 get() 一样按 retry_policy 重试；
+        开始读取响应体后已产出的数据无法重放，不再重试，只参与熔断统计。
+        """
+        breaker = get_breaker(parse_plat_name(event_id))
+        breaker.before_call()
+        try:
+            response = await self.retry_policy.run(lambda: self._open_stream(event_id))
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+
+        items = self._iter_items(response, chunk_size, parser or LogResultStreamParser())
+        try:
+            async for item in items:
+                yield item
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except GeneratorExit:
+            # 只会在 yield 处发生，即状态码检查已通过
+            breaker.record_success()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            await items.aclose()
+            await response.aclose()
+
+    async def _open_stream(self, event_id: str) -> httpx.Response:
+        """发出一次流式请求（先按平台限流），返回已收到响应头的响应；非 2xx 时关闭响应并抛出 HTTPStatusError"""
+        await get_rate_limiter(parse_plat_name(event_id)).acquire()
+        client = self.client
+        request = client.build_request("GET", self.base_url, **self.request_kwargs(event_id))
+        response = await client.send(request, stream=True)
+        self._absorb_set_cookie(response)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            await response.aclose()
+            raise
+        return response
+
+    async def _iter_items(
+        self,
+        response: httpx.Response,
+        chunk_size: int,
+        parser: LogResultStreamParser,
+    ) -> AsyncIterator[dict]:
+        """按块读取响应体并增量解析"""
+        head = b""
+        async for chunk in response.aiter_bytes(chunk_size):
+            if parser.items_parsed == 0 and len(head) < LOGIN_SNIFF_BYTES:
+                head += chunk[:LOGIN_SNIFF_BYTES]
+            try:
+                items = parser.feed(chunk)
+            except LogServiceError:
+                _raise_if_login_required(head)
+                raise
+            for item in items:
+                yield item
+        try:
+            items = parser.close()
+        except LogServiceError:
+            _raise_if_login_required(head)
+            raise
+        for item in items:
+            yield item
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+        self.close_sync()
+
+    def close_sync(self):
+        """关闭同步连接池"""
+        if self._sync_client is not None:
+            self._sync_client.close()
+        self._sync_client = None
+
+
+def _raise_if_login_required(head: bytes):
+    """响应开头包含登录跳转标记时抛出 LoginRequiredError"""
+    if is_login_required(head):
+        text = head.decode("utf-8", errors="replace")
+        raise LoginRequiredError(f"{LOGIN_REQUIRED_ERROR}\n原始响应: {text[:500]}")
+
+
+async def iter_log_lines(event_id: str, client: Optional["LogServiceClient"] = None) -> AsyncIterator[str]:
+    """流式获取日志，逐行产出日志文本（content 或 jsonHeader）"""
+    client = client or get_log_client()
+    async for item in client.stream_items(event_id):
+        line = format_log_item(item)
+        if line is not None:
+            yield line
+
+
+# ============ 有预算的下载 ============
+class LogBudget:
+    """单次日志下载的字节/行数/ERROR 预算，各项为 0 表示不限制"""
+
+    def __init__(
+        self,
+        max_bytes: int = FETCH_MAX_BYTES,
+        max_lines: int = FETCH_MAX_LINES,
+        max_errors: int = FETCH_MAX_ERRORS,
+        error_context: int = FETCH_ERROR_CONTEXT,
+    ):
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.max_errors = max_errors
+        self.error_context = error_context
+
+    @property
+    def unlimited(self) -> bool:
+        """是否没有任何限制"""
+        return not (self.max_bytes or self.max_lines or self.max_errors)
+
+    @property
+    def key(self) -> tuple:
+        """用于合并并发请求的键，预算不同的请求结果不同"""
+        return (self.max_bytes, self.max_lines, self.max_errors, self.error_context)
+
+
+class BoundedLog(BaseModel):
+    """有预算的日志下载结果"""
+    lines: List[str]
+    error_lines: int
+    bytes_read: int
+    truncated: bool
+    reason: str = ""
+
+    def to_text(self) -> str:
+        """交给模型的日志文本，被截断时在末尾附加标记"""
+        if not self.lines:
+            return LOG_NOT_FOUND_ERROR
+        text = "\n".join(self.lines)
+        if self.truncated:
+            text += "\n" + truncated_marker(self.reason, self.bytes_read, len(self.lines), self.error_lines)
+        return text
+
+
+def truncated_marker(reason: str, bytes_read: int, lines: int, error_lines: int) -> str:
+    """下载被截断时附加在日志末尾的标记行"""
+    return f"{TRUNCATED_MARKER} {reason}，已停止下载（已读取 {bytes_read} 字节、{lines} 行、{error_lines} 条 ERROR）"
+
+
+async def stream_has_more(stream: AsyncIterator) -> bool:
+    """
+    预算用完后再取一个元素，判断响应中是否确实还有未读取的内容
+
+    已缓冲的元素直接返回，否则最多再读取一个分块；正好读到响应末尾时返回 False（不算截断）。
+    """
+    try:
+        await stream.__anext__()
+    except StopAsyncIteration:
+        return False
+    return True
+
+
+async def fetch_bounded_log(
+    event_id: str,
+    budget: Optional[LogBudget] = None,
+    client: Optional["LogServiceClient"] = None,
+) -> BoundedLog:
+    """
+    流式下载日志，超出预算时提前停止
+
+    - 已读取字节数或行数达到上限时停止
+    - 收集到 max_errors 条 ERROR 日志并再读取 error_context 行上下文后停止
+    停止时直接关闭连接，剩余响应不再下载；响应中确实还有未读取的日志时结果标记为 truncated。
+    """
+    budget = budget or LogBudget()
+    client = client or get_log_client()
+    parser = LogResultStreamParser()
+    lines: List[str] = []
+    error_lines = 0
+    context_left = -1  # 达到 ERROR 上限后还需读取的上下文行数
+    reason = ""
+    truncated = False
+
+    stream = client.stream_items(event_id, parser=parser)
+    try:
+        async for item in stream:
+            line = format_log_item(item)
+            if line is None:
+                continue
+            lines.append(line)
+
+            if ERROR_LEVEL_MARKER in line:
+                error_lines += 1
+                if budget.max_errors and error_lines == budget.max_errors:
+                    context_left = budget.error_context
+
+            if budget.max_bytes and parser.bytes_fed >= budget.max_bytes:
+                reason = f"超出下载字节上限 {budget.max_bytes}"
+            elif budget.max_lines and len(lines) >= budget.max_lines:
+                reason = f"超出行数上限 {budget.max_lines}"
+            elif context_left == 0:
+                reason = f"已收集 {budget.max_errors} 条 ERROR 及其上下文"
+            if reason:
+                # 日志正好在预算处结束时不算截断
+                truncated = await stream_has_more(stream)
+                break
+            if context_left > 0:
+                context_left -= 1
+    finally:
+        # 提前退出时关闭流，连接随之关闭
+        await stream.aclose()
+
+    return BoundedLog(
+        lines=lines,
+        error_lines=error_lines,
+        bytes_read=parser.bytes_fed,
+        truncated=truncated,
+        reason=reason if truncated else ""
+    )
+
+
+# 进程内共享的默认客户端
+_default_client: Optional[LogServiceClient] = None
+
+
+def get_log_client() -> LogServiceClient:
+    """获取进程内共享的日志服务客户端"""
+    global _default_client
+    if _default_client is None:
+        _default_client = LogServiceClient()
+    return _default_client
@@ -0,0 +1,307 @@
+"""
+列式日志存储
+- 把多个 EventID 的 LogRecord 按列保存在 numpy 数组中，而不是 Python 对象和字符串
+- 时间戳为 datetime64[ms]，级别为 uint8 编码；模块、源文件、IP 等重复率高的列做字典编码
+- 日志内容按 MESSAGE_BLOCK_ROWS 行一块拼接为 UTF-8 字节并用 zlib 压缩，按需解压
+- 支持按级别、模块前缀、时间范围、EventID 做向量化过滤
+
+示例:
+    builder = LogStoreBuilder()
+    builder.add(parse_lines(log_text.split("\\n")), event_id)
+    store = builder.build()
+    rows = store.query(levels=["ER"], module_prefix="app.coupon")
+    for record in store.records(rows):
+        ...
+"""
+
+import os
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from log_parser import LEVEL_ERROR, LEVEL_INFO, LEVEL_WARN, LogRecord, parse_timestamps
+
+# 级别编码，0 表示不符合格式的行
+LEVEL_CODES = {LEVEL_INFO: 1, LEVEL_WARN: 2, LEVEL_ERROR: 3}
+_LEVEL_NAMES = ["", LEVEL_INFO, LEVEL_WARN, LEVEL_ERROR]
+_OTHER_LEVEL = 4  # 未知级别
+
+TimeLike = Union[str, np.datetime64]
+
+# 日志内容每块的行数与 zlib 压缩级别
+MESSAGE_BLOCK_ROWS = int(os.getenv("LOG_STORE_BLOCK_ROWS", "4096"))
+MESSAGE_COMPRESS_LEVEL = int(os.getenv("LOG_STORE_COMPRESS_LEVEL", "1"))
+
+
+class Dictionary:
+    """字典编码：字符串 <-> 整数编码"""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: str) -> Optional[int]:
+        return self._codes.get(value)
+
+    def codes_with_prefix(self, prefix: str) -> np.ndarray:
+        """所有以 prefix 开头的值的编码"""
+        return np.array([code for code, value in enumerate(self.values) if value.startswith(prefix)], dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def nbytes(self) -> int:
+        """字典本身占用的字节数（近似）"""
+        return sum(len(value.encode("utf-8")) + 50 for value in self.values)
+
+
+class LogStoreBuilder:
+    """逐批追加 LogRecord，最后生成不可变的 LogStore"""
+
+    def __init__(self):
+        self.events = Dictionary()
+        self.modules = Dictionary()
+        self.srcs = Dictionary()
+        self.ips = Dictionary()
+        self.serials = Dictionary()
+        self.openids = Dictionary()
+        # 同一秒内的日志时间戳相同，先字典编码，build 时只解析不同的值
+        self.timestamps = Dictionary()
+        self._event = array("i")
+        self._timestamp = array("i")
+        self._level = array("B")
+        self._module = array("i")
+        self._src = array("i")
+        self._line = array("i")
+        self._ip = array("i")
+        self._serial = array("i")
+        self._qq = array("q")
+        self._openid = array("i")
+        self._messages = bytearray()
+        self._offsets = array("q", [0])
+
+    def add(self, records: Iterable[LogRecord], event_id: str = "") -> int:
+        """追加一个 EventID 的日志，返回追加的行数"""
+        event = self.events.encode(event_id)
+        start = len(self._level)
+        module, src, ip, serial = self.modules.encode, self.srcs.encode, self.ips.encode, self.serials.encode
+        timestamp, openid = self.timestamps.encode, self.openids.encode
+        for record in records:
+            self._event.append(event)
+            self._timestamp.append(timestamp(record.timestamp))
+            self._level.append(LEVEL_CODES.get(record.level, _OTHER_LEVEL if record.level else 0))
+            self._module.append(module(record.module))
+            self._src.append(src(record.src))
+            self._line.append(record.line)
+            self._ip.append(ip(record.ip))
+            self._serial.append(serial(record.serial))
+            self._qq.append(int(record.qq) if record.qq.isdigit() else 0)
+            self._openid.append(openid(record.openid))
+            self._messages += record.message.encode("utf-8")
+            self._offsets.append(len(self._messages))
+        return len(self._level) - start
+
+    def build(self) -> "LogStore":
+        # 不符合格式的行时间戳为空，解析为 NaT
+        parsed = parse_timestamps(self.timestamps.values)
+        return LogStore(
+            events=self.events,
+            modules=self.modules,
+            srcs=self.srcs,
+            ips=self.ips,
+            serials=self.serials,
+            openids=self.openids,
+            event=np.frombuffer(self._event, dtype=np.int32).copy(),
+            timestamp=parsed[np.frombuffer(self._timestamp, dtype=np.int32)],
+            level=np.frombuffer(self._level, dtype=np.uint8).copy(),
+            module=np.frombuffer(self._module, dtype=np.int32).copy(),
+            src=np.frombuffer(self._src, dtype=np.int32).copy(),
+            line=np.frombuffer(self._line, dtype=np.int32).copy(),
+            ip=np.frombuffer(self._ip, dtype=np.int32).copy(),
+            serial=np.frombuffer(self._serial, dtype=np.int32).copy(),
+            qq=np.frombuffer(self._qq, dtype=np.int64).copy(),
+            openid=np.frombuffer(self._openid, dtype=np.int32).copy(),
+            messages=self._compress_messages(),
+            offsets=np.frombuffer(self._offsets, dtype=np.int64).copy(),
+        )
+
+    def _compress_messages(self) -> List[bytes]:
+        """按 MESSAGE_BLOCK_ROWS 行一块压缩日志内容"""
+        view = memoryview(self._messages)
+        offsets = self._offsets
+        rows = len(offsets) - 1
+        return [
+            zlib.compress(view[offsets[start]:offsets[min(start + MESSAGE_BLOCK_ROWS, rows)]], MESSAGE_COMPRESS_LEVEL)
+            for start in range(0, rows, MESSAGE_BLOCK_ROWS)
+        ]
+
+
+class LogStore:
+    """列式日志存储，由 LogStoreBuilder 生成"""
+
+    def __init__(
+        self,
+        events: Dictionary,
+        modules: Dictionary,
+        srcs: Dictionary,
+        ips: Dictionary,
+        serials: Dictionary,
+        openids: Dictionary,
+        event: np.ndarray,
+        timestamp: np.ndarray,
+        level: np.ndarray,
+        module: np.ndarray,
+        src: np.ndarray,
+        line: np.ndarray,
+        ip: np.ndarray,
+        serial: np.ndarray,
+        qq: np.ndarray,
+        openid: np.ndarray,
+        messages: List[bytes],
+        offsets: np.ndarray,
+    ):
+        self.events = events
+        self.modules = modules
+        self.srcs = srcs
+        self.ips = ips
+        self.serials = serials
+        self.openids = openids
+        self.event = event
+        self.timestamp = timestamp
+        self.level = level
+        self.module = module
+        self.src = src
+        self.line = line
+        self.ip = ip
+        self.serial = serial
+        self.qq = qq
+        self.openid = openid
+        self.messages = messages
+        self.offsets = offsets
+        # 最近解压的一块：(块号, 内容)，顺序读取时只解压一次
+        self._block = (-1, b"")
+
+    @classmethod
+    def from_records(cls, records: Iterable[LogRecord], event_id: str = "") -> "LogStore":
+        builder = LogStoreBuilder()
+        builder.add(records, event_id)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.level)
+
+    # ============ 过滤 ============
+    def level_mask(self, *levels: str) -> np.ndarray:
+        """级别属于 levels 的行，如 store.level_mask("ER")"""
+        codes = [LEVEL_CODES[level] for level in levels if level in LEVEL_CODES]
+        return np.isin(self.level, codes)
+
+    def module_mask(self, prefix: str) -> np.ndarray:
+        """模块名以 prefix 开头的行，如 store.module_mask("app.coupon")"""
+        return np.isin(self.module, self.modules.codes_with_prefix(prefix))
+
+    def time_mask(self, start: Optional[TimeLike] = None, end: Optional[TimeLike] = None) -> np.ndarray:
+        """时间在 [start, end) 内的行，不符合格式的行（NaT）不匹配"""
+        mask = ~np.isnat(self.timestamp)
+        if start is not None:
+            mask &= self.timestamp >= np.datetime64(start, "ms")
+        if end is not None:
+            mask &= self.timestamp < np.datetime64(end, "ms")
+        return mask
+
+    def event_mask(self, event_id: str) -> np.ndarray:
+        """属于某个 EventID 的行"""
+        code = self.events.code_of(event_id)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.event == code
+
+    def query(
+        self,
+        levels: Optional[Sequence[str]] = None,
+        module_prefix: Optional[str] = None,
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None,
+        event_id: Optional[str] = None,
+    ) -> np.ndarray:
+        """组合过滤条件，返回匹配行的下标"""
+        mask = np.ones(len(self), dtype=bool)
+        if levels is not None:
+            mask &= self.level_mask(*levels)
+        if module_prefix is not None:
+            mask &= self.module_mask(module_prefix)
+        if start is not None or end is not None:
+            mask &= self.time_mask(start, end)
+        if event_id is not None:
+            mask &= self.event_mask(event_id)
+        return np.flatnonzero(mask)
+
+    # ============ 读取 ============
+    def message(self, row: int) -> str:
+        block = row // MESSAGE_BLOCK_ROWS
+        if self._block[0] != block:
+            self._block = (block, zlib.decompress(self.messages[block]))
+        base = self.offsets[block * MESSAGE_BLOCK_ROWS]
+        return self._block[1][self.offsets[row] - base:self.offsets[row + 1] - base].decode("utf-8")
+
+    def record(self, row: int) -> LogRecord:
+        """还原为 LogRecord"""
+        level = int(self.level[row])
+        timestamp = "" if np.isnat(self.timestamp[row]) else str(self.timestamp[row]).replace("T", " ")
+        if timestamp.endswith(".000"):
+            timestamp = timestamp[:-4]
+        qq = int(self.qq[row])
+        return LogRecord(
+            self.ips.values[self.ip[row]],
+            str(qq) if qq else "",
+            timestamp,
+            _LEVEL_NAMES[level] if level < len(_LEVEL_NAMES) else "?",
+            self.srcs.values[self.src[row]],
+            int(self.line[row]),
+            self.serials.values[self.serial[row]],
+            self.modules.values[self.module[row]],
+            self.openids.values[self.openid[row]],
+            self.message(row),
+        )
+
+    def records(self, rows: Optional[Iterable[int]] = None) -> Iterator[LogRecord]:
+        for row in range(len(self)) if rows is None else rows:
+            yield self.record(int(row))
+
+    # ============ 统计 ============
+    def level_counts(self, rows: Optional[np.ndarray] = None) -> Dict[str, int]:
+        levels = self.level if rows is None else self.level[rows]
+        counts = np.bincount(levels, minlength=len(_LEVEL_NAMES))
+        # 不符合格式的行（0）与未知级别（_OTHER_LEVEL 及以上）都计入 "其他"
+        result = {_LEVEL_NAMES[code]: int(n) for code, n in enumerate(counts[1:len(_LEVEL_NAMES)], 1) if n}
+        other = int(counts[0] + counts[len(_LEVEL_NAMES):].sum())
+        if other:
+            result["其他"] = other
+        return result
+
+    def module_counts(self, rows: Optional[np.ndarray] = None) -> Dict[str, int]:
+        modules = self.module if rows is None else self.module[rows]
+        counts = np.bincount(modules, minlength=len(self.modules))
+        order = np.argsort(-counts, kind="stable")
+        return {self.modules.values[code]: int(counts[code]) for code in order if counts[code]}
+
+    def nbytes(self) -> int:
+        """占用的字节数（数组 + 内容 + 字典）"""
+        arrays = (
+            self.event, self.timestamp, self.level, self.module, self.src, self.line,
+            self.ip, self.serial, self.qq, self.openid, self.offsets,
+        )
+        dictionaries = (self.events, self.modules, self.srcs, self.ips, self.serials, self.openids)
+        messages = sum(len(block) for block in self.messages)
+        return sum(a.nbytes for a in arrays) + messages + sum(d.nbytes() for d in dictionaries)
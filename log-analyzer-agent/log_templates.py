@@ -0,0 +1,211 @@
+"""
+日志模板挖掘（Drain 算法）
+- 逐行处理 LogRecord.message，把只在 QQ、订单号、耗时等变量上不同的行归为同一个模板
+- 输出 "模板 × 次数"，并保留每个变量位置上出现最多的取值作为示例
+- 错误风暴中成千上万条相似日志可以压缩成几十行摘要
+
+参考: He et al., "Drain: An Online Log Parsing Approach with Fixed Depth Tree", ICWS 2017
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from log_parser import LEVEL_ERROR, LEVEL_INFO, LEVEL_WARN, LogRecord
+
+# ============ 配置 ============
+# 前缀树深度（第一层按级别和 token 数，之后按前几个 token）
+TEMPLATE_TREE_DEPTH = int(os.getenv("LOG_TEMPLATE_DEPTH", "4"))
+# 与已有模板的相似度达到该值时归入该模板
+TEMPLATE_SIMILARITY = float(os.getenv("LOG_TEMPLATE_SIMILARITY", "0.5"))
+# 摘要中最多列出的模板数
+TEMPLATE_SUMMARY_LIMIT = int(os.getenv("LOG_TEMPLATE_SUMMARY_LIMIT", "30"))
+
+WILDCARD = "<*>"
+# 按空白和常见分隔符切分，分隔符本身也保留为 token，便于还原模板文本
+_TOKEN_SPLIT = re.compile(r"([\s=,:;\"'{}\[\]()|]+)")
+_HAS_DIGIT = re.compile(r"\d")
+# 每个节点最多的子节点数，超出后其余 token 都走通配节点
+_MAX_CHILDREN = 100
+# 每个变量位置最多记录的不同取值数
+_MAX_VALUES = 8
+_LEVEL_ORDER = {LEVEL_ERROR: 0, LEVEL_WARN: 1, LEVEL_INFO: 2}
+
+
+def tokenize(message: str) -> List[str]:
+    """切分日志内容；偶数下标是单词（可能为空），奇数下标是分隔符"""
+    return _TOKEN_SPLIT.split(message)
+
+
+class LogTemplate:
+    """一个日志模板及其统计"""
+
+    __slots__ = ("template_id", "level", "tokens", "count", "modules", "values", "first_index")
+
+    def __init__(self, template_id: int, level: str, tokens: List[str], first_index: int):
+        self.template_id = template_id
+        self.level = level
+        self.tokens = tokens
+        self.count = 0
+        self.modules: Counter = Counter()
+        # 变量位置 -> 取值计数
+        self.values: Dict[int, Counter] = {}
+        self.first_index = first_index
+
+    @property
+    def text(self) -> str:
+        return "".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        """单词位置上相同 token 的比例，以及模板中通配符的个数（用于打平时选择）"""
+        same = wildcards = words = 0
+        for i in range(0, len(tokens), 2):
+            words += 1
+            token = self.tokens[i]
+            if token == WILDCARD:
+                wildcards += 1
+            elif token == tokens[i]:
+                same += 1
+        return (same / words if words else 1.0), wildcards
+
+    def merge(self, tokens: List[str]):
+        """不同的位置改为通配符"""
+        for i, token in enumerate(tokens):
+            current = self.tokens[i]
+            if current != token and current != WILDCARD:
+                # 该位置第一次出现差异，此前的取值都是 current
+                self.tokens[i] = WILDCARD
+                self.values[i] = Counter({current: self.count})
+
+    def observe(self, tokens: List[str], module: str):
+        """计入一行日志及其变量取值"""
+        for i in self.values:
+            self._add_value(i, tokens[i])
+        self.count += 1
+        self.modules[module] += 1
+
+    def _add_value(self, i: int, token: str):
+        values = self.values[i]
+        if token in values or len(values) < _MAX_VALUES:
+            values[token] += 1
+
+    def variables(self, limit: int = 3) -> List[str]:
+        """每个变量位置最常见的取值，如 ["-6712×118, -6713×2", "1479ms, 310ms"]"""
+        return [
+            ", ".join(f"{value}×{n}" if n > 1 else value for value, n in self.values[i].most_common(limit))
+            for i in sorted(self.values)
+            if i % 2 == 0
+        ]
+
+    def __repr__(self) -> str:
+        return f"LogTemplate({self.level} ×{self.count} {self.text[:80]!r})"
+
+
+class TemplateMiner:
+    """
+    流式模板挖掘
+
+    示例:
+        miner = TemplateMiner()
+        for record in parse_lines(lines):
+            miner.add(record)
+        print(miner.summary())
+    """
+
+    def __init__(
+        self,
+        depth: int = TEMPLATE_TREE_DEPTH,
+        similarity: float = TEMPLATE_SIMILARITY,
+    ):
+        self.depth = depth
+        self.similarity = similarity
+        self.templates: List[LogTemplate] = []
+        self.lines = 0
+        # (级别, token 数) -> 前缀树
+        self._root: Dict[Tuple[str, int], dict] = {}
+        # 完全相同的内容（数字替换为通配符后）直接命中，跳过树查找
+        self._exact: Dict[Tuple[str, str], LogTemplate] = {}
+
+    def add(self, record: LogRecord) -> Optional[LogTemplate]:
+        """加入一行日志，返回所属模板；不符合格式的行忽略"""
+        if not record.is_parsed:
+            return None
+        index = self.lines
+        self.lines += 1
+
+        tokens = tokenize(record.message)
+        key = (record.level, "".join(WILDCARD if _HAS_DIGIT.search(t) else t for t in tokens))
+        template = self._exact.get(key)
+        if template is None:
+            template = self._match(record.level, tokens, index)
+            self._exact[key] = template
+        elif template.tokens != tokens:
+            template.merge(tokens)
+        template.observe(tokens, record.module)
+        return template
+
+    def add_all(self, records: Iterable[LogRecord]) -> "TemplateMiner":
+        for record in records:
+            self.add(record)
+        return self
+
+    def _match(self, level: str, tokens: List[str], index: int) -> LogTemplate:
+        """在前缀树中查找最相似的模板，找不到时新建"""
+        node = self._root.setdefault((level, len(tokens)), {})
+        for i in range(0, min(len(tokens), 2 * (self.depth - 2)), 2):
+            token = tokens[i]
+            if _HAS_DIGIT.search(token):
+                token = WILDCARD
+            if token not in node:
+                if len(node) >= _MAX_CHILDREN:
+                    token = WILDCARD
+                node = node.setdefault(token, {})
+            else:
+                node = node[token]
+        leaf: List[LogTemplate] = node.setdefault(None, [])
+
+        best, best_score = None, (-1.0, -1)
+        for template in leaf:
+            score = template.similarity(tokens)
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score[0] >= self.similarity:
+            best.merge(tokens)
+            return best
+
+        template = LogTemplate(len(self.templates) + 1, level, list(tokens), index)
+        leaf.append(template)
+        self.templates.append(template)
+        return template
+
+    def ranked(self, levels: Optional[Iterable[str]] = None) -> List[LogTemplate]:
+        """按级别（ER、WRN、INF）和出现次数排序的模板"""
+        levels = set(levels) if levels is not None else None
+        templates = [t for t in self.templates if levels is None or t.level in levels]
+        return sorted(templates, key=lambda t: (_LEVEL_ORDER.get(t.level, 3), -t.count, t.first_index))
+
+    def summary(self, levels: Optional[Iterable[str]] = None, limit: int = TEMPLATE_SUMMARY_LIMIT) -> str:
+        """
+        模板摘要文本，每个模板一行:
+            [#3] ER ×120 [app.user.login 80, app.coupon.available 40] call backend failed ret=<*> ... | 变量: -6712×118, -6713×2; 1479ms, 310ms
+        """
+        templates = self.ranked(levels)
+        covered = sum(t.count for t in templates)
+        lines = [f"[TEMPLATES] {covered} 行日志归纳为 {len(templates)} 个模板"]
+        for template in templates[:limit]:
+            modules = ", ".join(f"{module} {n}" for module, n in template.modules.most_common(3))
+            line = f"[#{template.template_id}] {template.level} ×{template.count} [{modules}] {template.text}"
+            variables = template.variables()
+            if variables:
+                line += " | 变量: " + "; ".join(variables)
+            lines.append(line)
+        if len(templates) > limit:
+            rest = templates[limit:]
+            lines.append(f"[#...] 另有 {len(rest)} 个模板，共 {sum(t.count for t in rest)} 行")
+        return "\n".join(lines)
+
+
+def mine_templates(records: Iterable[LogRecord]) -> TemplateMiner:
+    """对一组日志做模板挖掘"""
+    return TemplateMiner().add_all(records)
@@ -6,23 +6,85 @@
 """
 
 import os
+import re
 import json
 import asyncio
-import requests
+import inspect
+import functools
+import contextlib
+import httpx
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
+import json_codec
+from log_cache import (
+    AUTH_FAILURE_KEY,
+    CACHE_BYPASS,
+    NEGATIVE_AUTH_TTL,
+    NEGATIVE_NOT_FOUND_TTL,
+    get_log_cache,
+    get_negative_cache,
+)
+from resilience import CircuitOpenError
+from rule_engine import RULE_ENGINE_ENABLED, evaluate_rules
+from singleflight import SingleFlight
+from token_budget import TOOL_RESULT_MAX_TOKENS, fit_to_budget
+from log_digest import DEFAULT_RESULT_MODE, MODE_ERRORS, MODE_LEVELS, MODE_RAW, RESULT_MODES, digest_levels, digest_log
+from log_pipeline import fetch_digest
+from log_latency import LATENCY_TOP_K, analyze_latency
+from log_parser import LogRecord, parse_lines
+from log_store import LogStore, LogStoreBuilder
+from log_service import (
+    LOG_NOT_FOUND_ERROR,
+    LOGIN_REQUIRED_ERROR,
+    PARSE_OFFLOAD_THRESHOLD,
+    TRUNCATED_MARKER,
+    LogBudget,
+    LoginRequiredError,
+    LogServiceError,
+    fetch_bounded_log,
+    get_log_client,
+    parse_log_response_async,
+    parse_plat_name,
+)
+
 load_dotenv()
 
 # ============ 配置 ============
-LOG_SERVICE_URL = "http://help.ied.com/logplat/curl2.php"
+# 各工具默认的最大并发数（未列出的工具不限制）
+DEFAULT_TOOL_CONCURRENCY = {
+    "fetch_error_log": int(os.getenv("FETCH_ERROR_LOG_CONCURRENCY", "32")),
+    "check_server_status": int(os.getenv("CHECK_SERVER_STATUS_CONCURRENCY", "8")),
+}
+
+# 当前工具调用使用的执行器，由 LogAnalyzerAgent.execute_tool 设置，
+# 异步工具用它卸载 CPU 密集的解析工作
+tool_executor: ContextVar[Optional[Executor]] = ContextVar("tool_executor", default=None)
+
+# 并发的相同请求只执行一次：日志按 (plat_name, event_id) 合并，其余工具按 (工具名, 参数) 合并
+_fetch_flight = SingleFlight()
+_tool_flight = SingleFlight()
+COALESCED_TOOLS = {"check_server_status"}
+
+# ERROR 行超过该数量时，规则匹配放到执行器中
+RULE_OFFLOAD_ERRORS = 1000
+
+# 批量获取日志的并发上限
+BULK_GLOBAL_CONCURRENCY = int(os.getenv("BULK_GLOBAL_CONCURRENCY", "64"))
+BULK_PLATFORM_CONCURRENCY = int(os.getenv("BULK_PLATFORM_CONCURRENCY", "16"))
 
-# 认证 Cookie（从浏览器复制）
-# 在浏览器登录后，F12 -> Network -> 找到 curl2.php 请求 -> 复制 Cookie
-AUTH_COOKIE = os.getenv("LOG_SERVICE_COOKIE", "")
+# 用户输入中的 EventID，如 DJC-CF-1211212348-8RJKIC-529-425718：
+# 平台名开头（可含小写，如 LotteryV31），至少 3 段，其中至少一段是纯数字；不用 \b，中文紧挨着 EventID 时 \b 不成立
+EVENT_ID_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9-])"
+    r"[A-Za-z][A-Za-z0-9]*(?=(?:-[A-Za-z0-9]+)*?-\d+(?![A-Za-z0-9]))(?:-[A-Za-z0-9]+){2,}"
+    r"(?![A-Za-z0-9-])"
+)
 
 
 # ============ 数据模型 ============
@@ -53,70 +115,298 @@ class AnalysisReport(BaseModel):
     server_status: str
     risk_level: str  # low / medium / high / critical
     recommendation: str
+    source: str = "llm"  # rule（规则引擎直接生成）/ llm / fallback（模型输出无法解析）
 
 
 # ============ 工具函数 ============
-def fetch_error_log(event_id: str) -> str:
+async def fetch_error_log(
+    event_id: str,
+    mode: str = DEFAULT_RESULT_MODE,
+    bypass_cache: bool = CACHE_BYPASS,
+    budget: Optional[LogBudget] = None,
+) -> str:
     """
     根据 EventID 从日志服务获取原始错误日志
     
     EventID 格式: DJC-CF-1211212348-8RJKIC-529-425718
     - 前缀(如 DJC)表示平台名
+    
+    使用共享的异步连接池，等待日志服务期间不会阻塞事件循环。
+    成功解析的日志会写入本地持久化缓存，重复分析同一 EventID 时不再请求日志服务；
+    bypass_cache=True 时跳过缓存读取，强制重新获取。
+    同一 (plat_name, event_id) 的并发调用只会发出一次请求，所有调用者共享结果。
+    需要登录（全局）和日志为空（按 EventID）的结果会短时间负缓存，期间直接返回错误。
+    下载受 budget（默认 LogBudget()）限制：收集到足够的 ERROR 及上下文、
+    或超出字节/行数上限时提前停止，返回的文本末尾带 [TRUNCATED] 标记；被截断的日志不写入缓存。
+    
+    mode 决定返回给模型的内容（缓存中保存完整日志）：
+    - "errors": 只保留 ER 行及前后上下文，开头附带各级别行数（默认）
+    - "warnings": 同上，额外保留 WRN 行
+    - "templates": 所有级别的日志模板 × 次数及变量示例
+    - "raw": 完整日志
+    errors / warnings 在未命中缓存时边下载边筛选（见 log_pipeline），不在内存中保存完整日志；
+    完整日志不超过 PIPELINE_CACHE_MAX_BYTES 时仍会写入缓存。
     """
-    # 解析平台名（取第一个 - 之前的部分）
-    plat_name = event_id.split("-")[0] if "-" in event_id else "AMS"
-    
-    # 构建请求参数
-    params = {
-        "url": f"plat_name={plat_name}&serial_num={event_id}&source_charset=utf8",
-        "set": "",
-        "referer": "http://help.ied.com/helpv2/html/showInfo_v2.html"
-    }
+    if mode not in RESULT_MODES:
+        return f"[ERROR] 不支持的 mode: {mode}，可选值: {', '.join(RESULT_MODES)}"
+    plat_name = parse_plat_name(event_id)
     
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-        "Referer": "http://help.ied.com/helpv2/html/showInfo_v2.html"
-    }
+    if mode in MODE_LEVELS:
+        digest, _ = await _fetch_digest(event_id, mode, bypass_cache, budget)
+        return digest
     
-    # 添加认证 Cookie
-    if AUTH_COOKIE:
-        headers["Cookie"] = AUTH_COOKIE
+    result = await _fetch_raw_log(event_id, bypass_cache, budget)
+    if mode == MODE_RAW or result.startswith("[ERROR]"):
+        return result
+    digest = functools.partial(digest_log, result, mode, platform=plat_name)
+    if len(result) < PARSE_OFFLOAD_THRESHOLD:
+        return digest()
+    # 大日志的筛选放到执行器中，避免阻塞事件循环
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor.get(), digest)
+
+
+async def _fetch_digest(
+    event_id: str,
+    mode: str = MODE_ERRORS,
+    bypass_cache: bool = CACHE_BYPASS,
+    budget: Optional[LogBudget] = None,
+) -> Tuple[str, List[LogRecord]]:
+    """
+    errors / warnings 模式的 fetch_error_log，同时返回全部 ERROR 行的解析结果（供规则引擎使用）
     
-    try:
-        print(f"  📡 请求日志服务: {LOG_SERVICE_URL}")
-        print(f"     EventID: {event_id}, Platform: {plat_name}")
-        
-        response = requests.get(LOG_SERVICE_URL, params=params, headers=headers, timeout=30)
-        response.raise_for_status()
+    命中缓存时在执行器中筛选缓存的完整日志，否则边下载边筛选（见 log_pipeline）。
+    """
+    plat_name = parse_plat_name(event_id)
+    result = await _read_cache(plat_name, event_id, bypass_cache)
+    if result is None:
+        budget = budget or LogBudget()
         
-        content = response.text
+        async def fetch() -> Tuple[str, List[LogRecord]]:
+            # 在合并的请求内写缓存：并发调用者共享结果，只由发起请求的一方写入一次
+            digest, raw, errors = await _stream_digest(event_id, mode, budget)
+            # 缓存中只保存完整日志或错误；完整日志过大或被截断（raw 为 None）时不缓存，不能把摘要写进去
+            if raw is not None:
+                await _remember(plat_name, event_id, raw)
+            elif digest.startswith("[ERROR]"):
+                await _remember(plat_name, event_id, digest)
+            return digest, errors
         
-        # 检查是否需要登录
-        if "未找到登录" in content or "urlJump" in content:
-            return f"[ERROR] 需要登录认证。请在 .env 文件中设置 LOG_SERVICE_COOKIE\n原始响应: {content[:500]}"
+        return await _fetch_flight.do((plat_name, event_id, mode, budget.key), fetch)
+    
+    if result.startswith("[ERROR]"):
+        return result, []
+    digest = functools.partial(digest_levels, result, mode, platform=plat_name)
+    if len(result) < PARSE_OFFLOAD_THRESHOLD:
+        return digest()
+    # 大日志的筛选放到执行器中，避免阻塞事件循环
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor.get(), digest)
+
+
+async def _read_cache(plat_name: str, event_id: str, bypass_cache: bool) -> Optional[str]:
+    """读取日志缓存和负缓存，都未命中时返回 None（SQLite 读取放到默认线程池中）"""
+    if not bypass_cache:
+        # 缓存对象持有锁和连接，不能交给可能是进程池的 tool_executor
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, get_log_cache().get, plat_name, event_id)
+        if cached is not None:
+            print(f"  💾 命中日志缓存: {event_id}")
+            return cached
+    
+    # 登录失效期间、或近期确认不存在的 EventID，直接返回上次的错误
+    negative_cache = get_negative_cache()
+    failure = negative_cache.get(AUTH_FAILURE_KEY) or negative_cache.get((plat_name, event_id))
+    if failure is not None:
+        print(f"  🚫 命中负缓存: {event_id}")
+    return failure
+
+
+async def _remember(plat_name: str, event_id: str, result: str):
+    """成功的完整日志写入缓存（SQLite 写入放到默认线程池中），登录失效和日志为空写入负缓存"""
+    negative_cache = get_negative_cache()
+    if result.startswith(LOGIN_REQUIRED_ERROR):
+        # 登录失效影响所有 EventID，全局负缓存
+        negative_cache.put(AUTH_FAILURE_KEY, result, NEGATIVE_AUTH_TTL)
+    elif result.startswith(LOG_NOT_FOUND_ERROR):
+        negative_cache.put((plat_name, event_id), result, NEGATIVE_NOT_FOUND_TTL)
+    elif not result.startswith("[ERROR]"):
+        # 只缓存成功的结果
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, get_log_cache().put, plat_name, event_id, result)
+
+
+async def _fetch_raw_log(event_id: str, bypass_cache: bool, budget: Optional[LogBudget]) -> str:
+    """读取缓存或请求日志服务，返回完整日志文本或 [ERROR] 开头的错误"""
+    plat_name = parse_plat_name(event_id)
+    result = await _read_cache(plat_name, event_id, bypass_cache)
+    if result is not None:
+        return result
+    
+    budget = budget or LogBudget()
+    
+    async def fetch() -> str:
+        # 在合并的请求内写缓存：并发调用者共享结果，只由发起请求的一方写入一次
+        result = await _fetch_and_parse(event_id, budget)
+        # 被截断的日志不完整，不写入缓存，否则之后 mode="raw" 或预算更大的调用会拿到截断的副本
+        if not _is_truncated(result):
+            await _remember(plat_name, event_id, result)
+        return result
+    
+    return await _fetch_flight.do((plat_name, event_id, budget.key), fetch)
+
+
+def _is_truncated(text: str) -> bool:
+    """日志文本末尾是否带 [TRUNCATED] 标记"""
+    return text[text.rfind("\n") + 1:].startswith(TRUNCATED_MARKER)
+
+
+def _fetch_failure(e: Exception) -> str:
+    """把请求日志服务时的异常转换为交给模型的错误文本"""
+    if isinstance(e, CircuitOpenError):
+        # 熔断期间快速失败，提示模型不要反复重试
+        return f"[ERROR] {e}。日志服务暂时不可用，请勿重复调用 fetch_error_log，直接基于已有信息给出报告"
+    if isinstance(e, LoginRequiredError):
+        return str(e)
+    if isinstance(e, LogServiceError):
+        return f"[ERROR] {e}"
+    return f"[ERROR] 获取日志失败: {str(e)}"
+
+
+async def _fetch_and_parse(event_id: str, budget: LogBudget) -> str:
+    """请求日志服务并解析响应（由 fetch_error_log 合并并发调用）"""
+    plat_name = parse_plat_name(event_id)
+    client = get_log_client()
+    try:
+        print(f"  📡 请求日志服务: {client.base_url}")
+        print(f"     EventID: {event_id}, Platform: {plat_name}")
         
-        # 解析返回的 JavaScript 变量 (var log_result={...})
-        if content.startswith("var log_result="):
-            json_str = content[len("var log_result="):]
-            try:
-                log_data = json.loads(json_str)
-                # 提取实际日志内容
-                if "result" in log_data and isinstance(log_data["result"], list):
-                    logs = []
-                    for item in log_data["result"]:
-                        if "content" in item:
-                            logs.append(item["content"])
-                        elif "jsonHeader" in item:
-                            logs.append(json.dumps(item, ensure_ascii=False))
-                    return "\n".join(logs) if logs else json.dumps(log_data, ensure_ascii=False, indent=2)
-                return json.dumps(log_data, ensure_ascii=False, indent=2)
-            except json.JSONDecodeError:
-                return content
+        if budget.unlimited:
+            response = await client.get(event_id)
+            # 直接按字节解析（跳过编码探测）；大日志的解析放到执行器中，避免阻塞事件循环
+            return await parse_log_response_async(response.content, executor=tool_executor.get())
         
-        return content
+        # 边下载边解析，超出预算时提前关闭连接
+        bounded = await fetch_bounded_log(event_id, budget, client)
+        if bounded.truncated:
+            print(f"  ✂️  日志已截断: {bounded.reason}")
+        return bounded.to_text()
         
-    except requests.exceptions.RequestException as e:
-        return f"[ERROR] 获取日志失败: {str(e)}"
+    except (CircuitOpenError, LogServiceError, httpx.HTTPError) as e:
+        return _fetch_failure(e)
+
+
+async def _stream_digest(event_id: str, mode: str, budget: LogBudget) -> Tuple[str, Optional[str], List[LogRecord]]:
+    """边下载边筛选生成摘要，返回 (摘要或错误, 完整日志或 None, ERROR 行)（由 fetch_error_log 合并并发调用）"""
+    plat_name = parse_plat_name(event_id)
+    client = get_log_client()
+    try:
+        print(f"  📡 请求日志服务（流式筛选）: {client.base_url}")
+        print(f"     EventID: {event_id}, Platform: {plat_name}")
+        return await fetch_digest(
+            event_id, mode, budget=budget, platform=plat_name, client=client, executor=tool_executor.get()
+        )
+    except (CircuitOpenError, LogServiceError, httpx.HTTPError) as e:
+        return _fetch_failure(e), None, []
+
+
+async def fetch_error_logs(
+    event_ids: Iterable[str],
+    global_concurrency: int = BULK_GLOBAL_CONCURRENCY,
+    platform_concurrency: int = BULK_PLATFORM_CONCURRENCY,
+    bypass_cache: bool = CACHE_BYPASS,
+    mode: str = DEFAULT_RESULT_MODE,
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    批量获取多个 EventID 的日志
+    
+    按平台名前缀分组，每个平台最多 platform_concurrency 个并发请求，
+    所有平台合计最多 global_concurrency 个。结果按完成顺序逐个产出 (event_id, 日志文本)，
+    而不是按输入顺序。重复的 EventID 只获取一次。
+    
+    示例:
+        async for event_id, log_text in fetch_error_logs(event_ids):
+            ...
+    """
+    # 按平台分组（保持组内顺序，去重）
+    queues: Dict[str, asyncio.Queue] = {}
+    for event_id in dict.fromkeys(event_ids):
+        plat_name = parse_plat_name(event_id)
+        if plat_name not in queues:
+            queues[plat_name] = asyncio.Queue()
+        queues[plat_name].put_nowait(event_id)
+    
+    global_slots = asyncio.Semaphore(global_concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def worker(queue: asyncio.Queue):
+        while not queue.empty():
+            event_id = queue.get_nowait()
+            async with global_slots:
+                try:
+                    result = await fetch_error_log(event_id, mode=mode, bypass_cache=bypass_cache)
+                except Exception as e:
+                    # 单个 EventID 失败不影响其他请求
+                    result = f"[ERROR] 获取日志失败: {str(e)}"
+            await results.put((event_id, result))
+    
+    workers = [
+        asyncio.create_task(worker(queue))
+        for queue in queues.values()
+        for _ in range(min(platform_concurrency, queue.qsize()))
+    ]
+    total = sum(queue.qsize() for queue in queues.values())
+    try:
+        for _ in range(total):
+            yield await results.get()
+    finally:
+        # 调用方提前停止迭代时，取消尚未完成的请求
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def load_log_store(event_ids: Iterable[str], **kwargs) -> LogStore:
+    """
+    批量获取多个 EventID 的完整日志，载入列式存储做跨 EventID 的过滤和统计
+    
+    kwargs 透传给 fetch_error_logs（并发上限、bypass_cache）。获取失败的 EventID 跳过。
+    
+    示例:
+        store = await load_log_store(event_ids)
+        rows = store.query(levels=["ER"], module_prefix="app.coupon")
+        print(store.module_counts(rows))
+    """
+    builder = LogStoreBuilder()
+    loop = asyncio.get_running_loop()
+    # builder 有状态，只能在线程中修改；执行器是进程池时改用默认线程池
+    executor = tool_executor.get()
+    if isinstance(executor, ProcessPoolExecutor):
+        executor = None
+    async for event_id, text in fetch_error_logs(event_ids, mode=MODE_RAW, **kwargs):
+        if text.startswith("[ERROR]"):
+            print(f"  ⚠️  跳过 {event_id}: {text[:80]}")
+            continue
+        # 解析放到执行器中；结果逐个产出，builder 不会被并发访问
+        await loop.run_in_executor(executor, builder.add, parse_lines(text.split("\n")), event_id)
+    return builder.build()
+
+
+async def analyze_step_latency(event_id: str, top_k: int = LATENCY_TOP_K, bypass_cache: bool = CACHE_BYPASS) -> str:
+    """
+    分析 EventID 日志中各步骤的耗时
+    
+    在同一流水号和模块内计算相邻两行的时间间隔，列出最慢的 top_k 步并标记疑似超时（见 log_latency）。
+    与 fetch_error_log 共用日志缓存。
+    """
+    result = await _fetch_raw_log(event_id, bypass_cache, None)
+    if result.startswith("[ERROR]"):
+        return result
+    analyze = functools.partial(analyze_latency, result, int(top_k))
+    if len(result) < PARSE_OFFLOAD_THRESHOLD:
+        return analyze()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor.get(), analyze)
 
 
 def check_server_status(service_name: str) -> str:
@@ -239,13 +529,39 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "fetch_error_log",
-            "description": "根据 EventID 获取原始错误日志文本。返回的是非结构化的日志文本，包含时间戳、错误堆栈、上下文信息等，需要自行解析提取关键信息。",
+            "description": "根据 EventID 获取错误日志文本。默认只返回 ER 级别的日志行及前后几行上下文，开头附带各级别的行数统计；需要了解整体分布时可用 mode=templates 获取日志模板统计；信息不足时可用 mode=raw 获取完整日志。返回的是非结构化的日志文本，需要自行解析提取关键信息。",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "event_id": {
                         "type": "string",
                         "description": "错误事件的唯一标识符，如 EVT-2025121800042"
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": list(RESULT_MODES),
+                        "description": "errors: 只返回 ER 行及上下文（默认）；warnings: 额外返回 WRN 行；templates: 所有级别的日志模板 × 次数；raw: 完整日志"
+                    }
+                },
+                "required": ["event_id"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "analyze_step_latency",
+            "description": "根据 EventID 分析日志中各步骤的耗时：在同一流水号和模块内计算相邻两行的时间间隔，列出最慢的步骤（源文件:行号、前后两行内容）并标记疑似超时。怀疑超时、响应慢等耗时类问题时使用，不需要自己逐行计算时间差。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_id": {
+                        "type": "string",
+                        "description": "错误事件的唯一标识符，如 EVT-2025121800042"
+                    },
+                    "top_k": {
+                        "type": "integer",
+                        "description": f"列出的最慢步骤数，默认 {LATENCY_TOP_K}"
                     }
                 },
                 "required": ["event_id"]
@@ -274,6 +590,7 @@ TOOLS = [
 # 工具执行映射
 TOOL_FUNCTIONS = {
     "fetch_error_log": fetch_error_log,
+    "analyze_step_latency": analyze_step_latency,
     "check_server_status": check_server_status
 }
 
@@ -282,18 +599,38 @@ TOOL_FUNCTIONS = {
 class LogAnalyzerAgent:
     """错误日志分析 Agent"""
     
-    def __init__(self, debug: bool = True):
+    def __init__(
+        self,
+        debug: bool = True,
+        executor: Optional[Executor] = None,
+        tool_concurrency: Optional[Dict[str, int]] = None,
+        tool_result_tokens: int = TOOL_RESULT_MAX_TOKENS,
+        use_rules: bool = RULE_ENGINE_ENABLED,
+    ):
+        """
+        Args:
+            debug: 是否打印调试日志
+            executor: 同步工具与大日志解析使用的线程池/进程池，None 表示事件循环的默认线程池
+            tool_concurrency: 各工具的最大并发数，覆盖 DEFAULT_TOOL_CONCURRENCY
+            tool_result_tokens: 单个工具结果的 token 上限，超出时裁剪，0 表示不限制
+            use_rules: 是否先用规则引擎分析，命中已知错误时跳过模型
+        """
         self.client = AsyncOpenAI(
             base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
             api_key=os.getenv("OPENAI_API_KEY")
         )
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
         self.debug = debug  # 是否打印调试日志
+        self.executor = executor
+        self.tool_concurrency = {**DEFAULT_TOOL_CONCURRENCY, **(tool_concurrency or {})}
+        self._tool_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.tool_result_tokens = tool_result_tokens
+        self.use_rules = use_rules
         self.system_prompt = """你是一个专业的错误日志分析专家，专门分析道聚城(DJC)等腾讯游戏服务的日志。
 
 你的工作流程：
 1. 从用户输入中识别 EventID（格式如 DJC-CF-1211212348-8RJKIC-529-425718、AMS-H2-xxx 等）
-2. 调用 fetch_error_log 获取原始日志文本
+2. 调用 fetch_error_log 获取日志文本（默认只含 ER 行及上下文，必要时用 mode=raw 获取完整日志）
 3. **仔细解析日志内容**，从日志中提取关键信息
 4. 综合分析，生成报告
 
@@ -316,12 +653,13 @@ EventID 识别规则：
 1. 找出所有 ER（ERROR）级别的日志行
 2. 提取错误码（如 -6712）和错误信息
 3. 识别模块名（如 [app.coupon.available]）
-4. 分析调用链路和失败原因
+4. 分析调用链路和失败原因（工具结果中的 [CHAIN] 段已按流水号和模块整理出调用顺序、首个 ERROR 位置和步骤间耗时）
+   - [LATENCY] / [SLOW] 行列出最慢的步骤和疑似超时，需要更多耗时信息时调用 analyze_step_latency
 5. 提取关键上下文（QQ号、订单号、请求参数等）
 
-常见错误码含义：
-- 负数错误码通常表示后端服务返回的业务错误
-- "系统繁忙" 通常表示后端服务过载或超时
+错误码含义：
+- 工具结果中的 [KB] 行来自错误码知识库，给出已知错误码的含义、风险等级和处理建议，优先参考
+- 知识库中没有的负数错误码通常表示后端服务返回的业务错误
 
 输出要求：
 最终输出 JSON 格式的分析报告：
@@ -348,24 +686,107 @@ EventID 识别规则：
         if self.debug:
             print(f"  [DEBUG] {message}")
     
+    def _tool_slot(self, tool_name: str):
+        """获取工具的并发槽位，未配置上限时不限制"""
+        limit = self.tool_concurrency.get(tool_name)
+        if not limit:
+            return contextlib.nullcontext()
+        if tool_name not in self._tool_semaphores:
+            self._tool_semaphores[tool_name] = asyncio.Semaphore(limit)
+        return self._tool_semaphores[tool_name]
+    
     async def execute_tool(self, tool_name: str, arguments: dict) -> str:
-        """执行工具调用，返回字符串结果"""
-        if tool_name in TOOL_FUNCTIONS:
-            result = TOOL_FUNCTIONS[tool_name](**arguments)
-            # 工具返回的已经是字符串，直接返回
-            if isinstance(result, str):
-                return result
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        return f"Error: Unknown tool '{tool_name}'"
+        """执行工具调用，返回不超过 token 预算的字符串结果"""
+        if tool_name not in TOOL_FUNCTIONS:
+            return f"Error: Unknown tool '{tool_name}'"
+        
+        if tool_name in COALESCED_TOOLS:
+            # 相同参数的并发调用共享一次执行
+            key = (tool_name, json.dumps(arguments, sort_keys=True, ensure_ascii=False))
+            result = await _tool_flight.do(key, lambda: self._run_tool(tool_name, arguments))
+        else:
+            result = await self._run_tool(tool_name, arguments)
+        
+        # 工具返回的已经是字符串，直接使用
+        if not isinstance(result, str):
+            result = json_codec.dumps(result, indent=True)
+        return await self._fit_to_budget(result)
+    
+    async def _fit_to_budget(self, result: str) -> str:
+        """把工具结果裁剪到 token 预算以内，大结果放到执行器中处理"""
+        if len(result) < PARSE_OFFLOAD_THRESHOLD:
+            fitted = fit_to_budget(result, self.tool_result_tokens)
+        else:
+            loop = asyncio.get_running_loop()
+            fitted = await loop.run_in_executor(self.executor, fit_to_budget, result, self.tool_result_tokens)
+        if len(fitted) != len(result):
+            self._log(f"工具结果超出 token 预算，已从 {len(result)} 字符裁剪到 {len(fitted)} 字符")
+        return fitted
+    
+    async def _run_tool(self, tool_name: str, arguments: dict, func=None):
+        """
+        在并发槽位内运行工具：异步工具直接等待，同步工具放到执行器
+        
+        func 默认为 TOOL_FUNCTIONS[tool_name]；传入同一工具的变体（如 _fetch_digest）时仍占用 tool_name 的槽位。
+        """
+        func = func or TOOL_FUNCTIONS[tool_name]
+        async with self._tool_slot(tool_name):
+            if inspect.iscoroutinefunction(func):
+                # 异步工具直接在事件循环上等待，并可使用 Agent 的执行器卸载解析
+                token = tool_executor.set(self.executor)
+                try:
+                    return await func(**arguments)
+                finally:
+                    tool_executor.reset(token)
+            # 同步工具放到执行器中运行，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, **arguments))
+    
+    async def _analyze_with_rules(self, user_input: str) -> Optional[AnalysisReport]:
+        """从输入中识别 EventID 并用规则引擎分析日志，未命中规则时返回 None"""
+        match = EVENT_ID_PATTERN.search(user_input)
+        if match is None:
+            return None
+        event_id = match.group(0)
+        
+        # 与模型调用 fetch_error_log 走同一路径（并发上限、执行器），边下载边筛选，不先下载完整日志；
+        # 完整日志不太大时会写入缓存，未命中规则时模型再调用可直接命中
+        digest, errors = await self._run_tool(
+            "fetch_error_log", {"event_id": event_id, "mode": MODE_ERRORS}, func=_fetch_digest
+        )
+        if digest.startswith("[ERROR]"):
+            return None
+        evaluate = functools.partial(evaluate_rules, errors, platform=parse_plat_name(event_id))
+        if len(errors) < RULE_OFFLOAD_ERRORS:
+            rule_match = evaluate()
+        else:
+            loop = asyncio.get_running_loop()
+            rule_match = await loop.run_in_executor(self.executor, evaluate)
+        if rule_match is None:
+            self._log("规则引擎未命中，交给模型分析")
+            return None
+        
+        self._log(
+            f"命中规则 {rule_match.rule.name}: {rule_match.count}/{rule_match.total_errors} 条 ERROR"
+            f"（置信度 {rule_match.confidence:.0%}），跳过模型"
+        )
+        return AnalysisReport(event_id=event_id, source="rule", **rule_match.report_fields())
     
     async def analyze(self, user_input: str) -> AnalysisReport:
         """
         分析错误日志
         
+        开启规则引擎时先用规则分析，命中已知错误直接返回报告（source="rule"），否则交给模型。
+        
         Args:
             user_input: 用户输入，可以是纯 EventID，也可以是包含 EventID 的自然语言
                        例如: "我遇到问题了，流水号 DJC-CF-1211212348-8RJKIC-529-425718"
         """
+        if self.use_rules:
+            report = await self._analyze_with_rules(user_input)
+            if report is not None:
+                return report
+        
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_input}
@@ -401,7 +822,7 @@ EventID 识别规则：
             if assistant_message.tool_calls:
                 for tool_call in assistant_message.tool_calls:
                     tool_name = tool_call.function.name
-                    arguments = json.loads(tool_call.function.arguments)
+                    arguments = json_codec.loads(tool_call.function.arguments)
                     
                     print(f"  🔧 调用工具: {tool_name}")
                     print(f"     参数: {arguments}")
@@ -433,7 +854,7 @@ EventID 识别规则：
                     else:
                         json_str = content
                     
-                    report_data = json.loads(json_str.strip())
+                    report_data = json_codec.loads(json_str.strip())
                     return AnalysisReport(**report_data)
                 except (json.JSONDecodeError, IndexError, KeyError) as e:
                     self._log(f"JSON 解析失败: {e}")
@@ -444,7 +865,8 @@ EventID 识别规则：
                         error_summary=content[:200] if content else "无法解析模型输出",
                         server_status="未知",
                         risk_level="medium",
-                        recommendation="请检查 Agent 输出格式"
+                        recommendation="请检查 Agent 输出格式",
+                        source="fallback"
                     )
         
         raise RuntimeError("Agent 达到最大迭代次数，未能完成分析")
@@ -481,6 +903,7 @@ async def main():
             print(f"服务器状态:  {report.server_status}")
             print(f"风险等级:    {report.risk_level}")
             print(f"处理建议:    {report.recommendation}")
+            print(f"报告来源:    {report.source}")
             
         except Exception as e:
             print(f"❌ 分析失败: {e}")
@@ -488,6 +911,9 @@ async def main():
             traceback.print_exc()
         
         print()
+    
+    # 关闭共享连接池
+    await get_log_client().aclose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+"""
+日志服务容错
+- 带指数退避和随机抖动的有限次重试（连接错误、超时、5xx）
+- 按 plat_name 划分的熔断器：后端故障期间快速失败，不再堆积慢超时
+- 按 plat_name 划分的令牌桶限流：以后端可承受的最高速率发送请求，避免触发服务端限流
+- 熔断器与限流器状态以指标形式导出
+"""
+
+import os
+import time
+import random
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# ============ 配置 ============
+RETRY_ATTEMPTS = int(os.getenv("LOG_SERVICE_RETRY_ATTEMPTS", "3"))  # 含首次请求
+BACKOFF_BASE = float(os.getenv("LOG_SERVICE_BACKOFF_BASE", "0.2"))  # 秒
+BACKOFF_MAX = float(os.getenv("LOG_SERVICE_BACKOFF_MAX", "5"))  # 秒
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LOG_SERVICE_BREAKER_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("LOG_SERVICE_BREAKER_RECOVERY", "30"))  # 秒
+
+# 限流：默认每个平台每秒请求数与突发容量，0 表示不限流
+DEFAULT_RATE = float(os.getenv("LOG_SERVICE_RATE", "20"))
+DEFAULT_BURST = float(os.getenv("LOG_SERVICE_BURST", "40"))
+# 按平台覆盖，格式 "DJC=20:40,AMS=10:20,LotteryV31=5"（速率:突发容量，容量可省略）
+RATE_LIMITS = os.getenv("LOG_SERVICE_RATE_LIMITS", "")
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"日志服务 {name} 熔断中，{retry_after:.0f} 秒后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """连接错误、超时和 5xx 响应可以重试，其余错误（如 4xx）直接失败"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+# ============ 重试 ============
+class RetryPolicy:
+    """指数退避 + 全抖动（full jitter）的重试策略"""
+
+    def __init__(self, attempts: int = RETRY_ATTEMPTS, base: float = BACKOFF_BASE, max_delay: float = BACKOFF_MAX):
+        self.attempts = max(1, attempts)
+        self.base = base
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（attempt 从 0 开始）"""
+        return random.uniform(0, min(self.max_delay, self.base * (2 ** attempt)))
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn()，遇到可重试错误时退避后重试"""
+        for attempt in range(self.attempts):
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt == self.attempts - 1 or not is_retryable(e):
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+        raise AssertionError("unreachable")
+
+
+# ============ 熔断器 ============
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 拒绝所有请求，recovery_timeout 后进入 half_open
+    - half_open: 只放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        # 指标
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """请求前检查，熔断中时抛出 CircuitOpenError"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """记录一次成功请求"""
+        self.successes += 1
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        """记录一次失败请求"""
+        self.failures += 1
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """请求既未成功也未失败（如被取消）时释放试探名额"""
+        self._trial_in_flight = False
+
+    def metrics(self) -> dict:
+        """熔断器指标"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
+
+
+# 按 plat_name 划分的熔断器
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(plat_name: str) -> CircuitBreaker:
+    """获取指定平台的熔断器"""
+    breaker = _breakers.get(plat_name)
+    if breaker is None:
+        breaker = _breakers[plat_name] = CircuitBreaker(plat_name)
+    return breaker
+
+
+# ============ 限流 ============
+class TokenBucket:
+    """
+    异步令牌桶
+
+    令牌以 rate 个/秒的速度补充，最多积攒 capacity 个。
+    取令牌时先预扣（允许余额为负），再按欠额等待，等待者按到达顺序获得令牌。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # 指标
+        self.acquired = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """取出令牌，不足时等待"""
+        self.acquired += 1
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens -= tokens
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+            self.throttled += 1
+            self.wait_seconds += wait
+            await asyncio.sleep(wait)
+
+    def metrics(self) -> dict:
+        """限流器指标"""
+        if self.rate > 0:
+            self._refill()
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+def parse_rate_limits(spec: str) -> Dict[str, tuple]:
+    """解析 "DJC=20:40,AMS=10" 格式的限流配置，返回 {plat_name: (rate, capacity)}"""
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        plat_name, _, value = part.partition("=")
+        rate, _, capacity = value.partition(":")
+        limits[plat_name.strip()] = (float(rate), float(capacity) if capacity else None)
+    return limits
+
+
+_rate_limit_config = parse_rate_limits(RATE_LIMITS)
+_rate_limiters: Dict[str, TokenBucket] = {}
+
+
+def get_rate_limiter(plat_name: str) -> TokenBucket:
+    """获取指定平台的限流器"""
+    limiter = _rate_limiters.get(plat_name)
+    if limiter is None:
+        rate, capacity = _rate_limit_config.get(plat_name, (DEFAULT_RATE, DEFAULT_BURST))
+        limiter = _rate_limiters[plat_name] = TokenBucket(rate, capacity)
+    return limiter
+
+
+def configure_rate_limit(plat_name: str, rate: float, capacity: Optional[float] = None):
+    """运行时调整某个平台的限流速率"""
+    _rate_limit_config[plat_name] = (rate, capacity)
+    _rate_limiters.pop(plat_name, None)
+
+
+def rate_limiter_metrics() -> Dict[str, dict]:
+    """导出限流器指标，{plat_name: metrics}"""
+    return {name: limiter.metrics() for name, limiter in _rate_limiters.items()}
+
+
+def breaker_metrics(plat_name: Optional[str] = None) -> Dict[str, dict]:
+    """导出熔断器指标，{plat_name: metrics}"""
+    if plat_name is not None:
+        return {plat_name: get_breaker(plat_name).metrics()}
+    return {name: breaker.metrics() for name, breaker in _breakers.items()}
@@ -0,0 +1,255 @@
+"""
+规则引擎
+- 在调用模型之前，先用确定性规则分析日志：提取 ERROR 行的错误码和模块
+- 大部分 ERROR 命中同一条已知规则时，直接生成分析报告，跳过模型调用
+- 规则按顺序匹配，更具体的规则（如指定模块）放在前面
+- 指定错误码的规则只在带该错误码的 ERROR 中计算占比；更具体的规则只覆盖其中一部分、难以判断时交给模型
+- 命中规则之外的 ERROR 中有更严重（或知识库中查不到）的错误码时不走快速路径，交给模型综合判断
+- 已知错误码（含按模块区分的条目）统一维护在错误码知识库（见 error_kb）中，内置规则只保留知识库无法表达的
+  （如按日志内容匹配）；内置规则都未命中时，按主要错误码在知识库中的条目生成报告
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from error_kb import ErrorCodeEntry, get_error_kb
+from log_parser import LEVEL_ERROR, LogRecord, extract_error_code, extract_error_message, parse_lines
+
+# ============ 配置 ============
+RULE_ENGINE_ENABLED = os.getenv("RULE_ENGINE_ENABLED", "1") == "1"
+# 命中规则的 ERROR 行占比达到该值时，才直接生成报告
+# （指定错误码的规则：该错误码占全部 ERROR、命中规则的行占该错误码的 ERROR 都要达到该值）
+RULE_MIN_CONFIDENCE = float(os.getenv("RULE_MIN_CONFIDENCE", "0.6"))
+# 风险等级，由低到高
+RISK_LEVELS = ("low", "medium", "high", "critical")
+
+
+class Rule:
+    """
+    一条已知错误的处理规则
+
+    code / module_prefix / pattern 同时满足时命中（为 None 的条件忽略，三者至少给一个）。
+    报告文本中可使用 {code} {module} {message} {count} {total} 占位符。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        error_summary: str,
+        server_status: str,
+        risk_level: str,
+        recommendation: str,
+        code: Optional[str] = None,
+        module_prefix: Optional[str] = None,
+        pattern: Optional[str] = None,
+        error_code: str = "{code}",
+    ):
+        if code is None and module_prefix is None and pattern is None:
+            raise ValueError(f"规则 {name} 至少需要 code、module_prefix、pattern 之一")
+        self.name = name
+        self.code = code
+        self.module_prefix = module_prefix
+        self.pattern = re.compile(pattern) if pattern else None
+        self.error_code = error_code
+        self.error_summary = error_summary
+        self.server_status = server_status
+        self.risk_level = risk_level
+        self.recommendation = recommendation
+
+    def matches(self, record: LogRecord, code: str) -> bool:
+        if self.code is not None and code != self.code:
+            return False
+        if self.module_prefix is not None and not record.module.startswith(self.module_prefix):
+            return False
+        if self.pattern is not None and not self.pattern.search(record.message):
+            return False
+        return True
+
+    @property
+    def specific(self) -> bool:
+        """指定错误码之外还有模块或内容条件，只覆盖该错误码的一部分 ERROR"""
+        return self.code is not None and (self.module_prefix is not None or self.pattern is not None)
+
+
+class RuleMatch:
+    """规则命中结果"""
+
+    def __init__(
+        self,
+        rule: Rule,
+        records: List[LogRecord],
+        codes: List[str],
+        total_errors: int,
+        confidence: Optional[float] = None,
+    ):
+        self.rule = rule
+        self.records = records
+        self.count = len(records)
+        self.total_errors = total_errors
+        if confidence is None:
+            confidence = self.count / total_errors if total_errors else 0.0
+        self.confidence = confidence
+        self.code = Counter(codes).most_common(1)[0][0]
+        self.module = Counter(record.module for record in records).most_common(1)[0][0]
+        self.message = Counter(extract_error_message(record.message) for record in records).most_common(1)[0][0]
+        self.first = records[0]
+
+    def report_fields(self) -> Dict[str, str]:
+        """AnalysisReport 中除 event_id 外的字段"""
+        values = {
+            "code": self.code,
+            "module": self.module,
+            "message": self.message,
+            "count": self.count,
+            "total": self.total_errors,
+        }
+        rule = self.rule
+        return {
+            "error_code": rule.error_code.format(**values),
+            "error_summary": rule.error_summary.format(**values),
+            "server_status": rule.server_status.format(**values),
+            "risk_level": rule.risk_level,
+            "recommendation": rule.recommendation.format(**values),
+        }
+
+
+# ============ 内置规则 ============
+# 错误码相关的规则放在 error_codes.json 中，这里只放按内容匹配等知识库无法表达的规则
+DEFAULT_RULES = [
+    Rule(
+        name="backend-timeout",
+        pattern=r"timeout|超时",
+        error_code="TIMEOUT",
+        error_summary="{module} 调用后端超时，{count}/{total} 条 ERROR，相关功能请求失败",
+        server_status="后端服务响应缓慢或不可用（degraded）",
+        risk_level="high",
+        recommendation="检查后端服务的响应时间和超时配置，排查慢查询或下游依赖，必要时扩容",
+    ),
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def rule_from_kb(entry: ErrorCodeEntry) -> Rule:
+    """由知识库条目生成规则"""
+    return Rule(
+        name=f"kb:{entry.platform}/{entry.module}/{entry.code}",
+        code=entry.code,
+        error_summary=f"{{module}} 返回 {{code}}（{_escape(entry.meaning)}），{{count}}/{{total}} 条 ERROR",
+        server_status=_escape(entry.server_status or f"已知错误码：{entry.meaning}"),
+        risk_level=entry.risk_level,
+        recommendation=_escape(entry.recommendation),
+    )
+
+
+def evaluate_rules(
+    records: Iterable[LogRecord],
+    rules: Optional[List[Rule]] = None,
+    min_confidence: float = RULE_MIN_CONFIDENCE,
+    platform: str = "",
+) -> Optional[RuleMatch]:
+    """
+    按顺序匹配规则，返回第一条置信度达标的规则
+
+    指定错误码的规则，置信度取「该错误码占全部 ERROR 的比例」和「命中的行占该错误码 ERROR 的比例」中较小的一个。
+    更具体的规则（如 -6712 且在 app.pay 模块）只命中该错误码的一部分、又不能排除时（占比在
+    1 - min_confidence 与 min_confidence 之间），不退回到较宽泛的规则，直接返回 None 交给模型。
+    都不达标时，若占比达标的主要错误码在知识库中有记录，返回由知识库条目生成的规则：
+    该错误码的 ERROR 按各自模块查到的条目（如 app.pay 的专门条目与通用条目）分组，
+    同样要求最多的一组占比达标，否则返回 None 交给模型。
+    命中规则之外的 ERROR 带有比命中规则风险更高、或知识库中查不到的错误码时，返回 None 交给模型，
+    避免报告只反映占多数的低风险错误（如大量「已领完」掩盖少量支付失败）。
+    没有 ERROR 或仍未命中时返回 None。
+    """
+    errors = [record for record in records if record.level == LEVEL_ERROR]
+    if not errors:
+        return None
+    codes = [extract_error_code(record.message) for record in errors]
+    pairs = list(zip(errors, codes))
+    match = _match_rules(pairs, rules, min_confidence, platform)
+    if match is None or _outranked(match, pairs, platform):
+        return None
+    return match
+
+
+def _risk_rank(level: str) -> int:
+    """风险等级的序号，未知等级视为最高"""
+    return RISK_LEVELS.index(level) if level in RISK_LEVELS else len(RISK_LEVELS)
+
+
+def _outranked(match: RuleMatch, pairs: List[Tuple[LogRecord, str]], platform: str) -> bool:
+    """命中规则之外的 ERROR 中，是否有风险更高或无法判断风险的错误码（没有错误码的行不计）"""
+    matched = set(map(id, match.records))
+    rank = _risk_rank(match.rule.risk_level)
+    kb = get_error_kb()
+    for record, code in pairs:
+        if not code or id(record) in matched:
+            continue
+        entry = kb.lookup(platform, record.module, code) if kb is not None else None
+        if entry is None:
+            if code != match.code:
+                return True
+        elif _risk_rank(entry.risk_level) > rank:
+            return True
+    return False
+
+
+def _match_rules(
+    pairs: List[Tuple[LogRecord, str]],
+    rules: Optional[List[Rule]],
+    min_confidence: float,
+    platform: str,
+) -> Optional[RuleMatch]:
+    """按 evaluate_rules 的规则匹配内置规则和知识库，不检查其余错误码"""
+    errors = [record for record, _ in pairs]
+    codes = [code for _, code in pairs]
+
+    for rule in DEFAULT_RULES if rules is None else rules:
+        scope = pairs if rule.code is None else [(record, code) for record, code in pairs if code == rule.code]
+        coverage = len(scope) / len(errors)
+        if coverage < min_confidence:
+            continue
+        matched = [(record, code) for record, code in scope if rule.matches(record, code)]
+        share = len(matched) / len(scope)
+        if matched and min(coverage, share) >= min_confidence:
+            matched_records, matched_codes = zip(*matched)
+            return RuleMatch(rule, list(matched_records), list(matched_codes), len(errors), min(coverage, share))
+        if rule.specific and share > 1 - min_confidence:
+            return None
+
+    kb = get_error_kb()
+    code_counts = Counter(code for code in codes if code)
+    if kb is None or not code_counts:
+        return None
+    code, count = code_counts.most_common(1)[0]
+    coverage = count / len(errors)
+    if coverage < min_confidence:
+        return None
+    groups: Dict[Tuple[str, str], List[LogRecord]] = {}
+    entries: Dict[Tuple[str, str], ErrorCodeEntry] = {}
+    for record, record_code in pairs:
+        if record_code != code:
+            continue
+        entry = kb.lookup(platform, record.module, code)
+        if entry is None:
+            continue
+        key = (entry.platform, entry.module)
+        entries[key] = entry
+        groups.setdefault(key, []).append(record)
+    if not groups:
+        return None
+    key, matched_records = max(groups.items(), key=lambda item: len(item[1]))
+    share = len(matched_records) / count
+    if share < min_confidence:
+        return None
+    confidence = min(coverage, share)
+    return RuleMatch(rule_from_kb(entries[key]), matched_records, [code] * len(matched_records), len(errors), confidence)
+
+
+def evaluate_log(text: str, rules: Optional[List[Rule]] = None, platform: str = "") -> Optional[RuleMatch]:
+    """对 fetch_error_log 返回的完整日志文本匹配规则"""
+    return evaluate_rules(parse_lines(text.split("\n"), keep_unparsed=False), rules, platform=platform)
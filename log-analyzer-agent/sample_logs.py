@@ -0,0 +1,102 @@
+"""
+合成日志数据
+- 生成符合 DJC 日志格式的日志行
+- 生成 curl2.php 风格的 var log_result= 响应
+供基准测试和本地压测使用
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+MODULES = [
+    "app.coupon.available",
+    "app.coupon.receive",
+    "app.order.create",
+    "app.order.query",
+    "app.user.login",
+    "app.pay.notify",
+]
+SOURCES = ["CouponService.php", "OrderService.php", "UserService.php", "PayService.php", "BaseModule.php"]
+MESSAGES = [
+    "request start, params={{\"actId\":\"{act}\",\"goodsId\":\"{goods}\"}}",
+    "call backend svr=coupon_svr cmd=0x{cmd:04x} cost={cost}ms",
+    "query order orderId=DJC{order} status=1",
+    "check user qualification ok, area={area}",
+    "response ret=0 msg=ok cost={cost}ms",
+]
+ERROR_MESSAGES = [
+    "call backend failed ret=-6712 msg=系统繁忙，请稍后再试 cost={cost}ms",
+    "coupon not available ret=-6713 msg=优惠券已领完",
+    "backend timeout svr=order_svr cmd=0x{cmd:04x} cost={cost}ms",
+]
+WARN_MESSAGES = [
+    "slow request cost={cost}ms threshold=500ms",
+    "retry backend svr=coupon_svr times=1",
+]
+
+
+def make_log_line(
+    ts: datetime,
+    serial: str,
+    rng: random.Random,
+    error_rate: float = 0.05,
+    warn_rate: float = 0.05,
+) -> str:
+    """生成一行 DJC 格式日志，时间戳为 ts"""
+    roll = rng.random()
+    if roll < error_rate:
+        level, template = "ER", rng.choice(ERROR_MESSAGES)
+    elif roll < error_rate + warn_rate:
+        level, template = "WRN", rng.choice(WARN_MESSAGES)
+    else:
+        level, template = "INF", rng.choice(MESSAGES)
+    message = template.format(
+        act=rng.randint(10000, 99999),
+        goods=rng.randint(100000, 999999),
+        cmd=rng.randint(0, 0xFFFF),
+        cost=rng.randint(1, 3000),
+        order=rng.randint(10 ** 11, 10 ** 12 - 1),
+        area=rng.randint(1, 50),
+    )
+    return (
+        f"[F:10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}|QQ:{rng.randint(10 ** 8, 10 ** 10)}]"
+        f"{ts.strftime('%Y-%m-%d %H:%M:%S')}|{level}||"
+        f"[{rng.choice(SOURCES)}:{rng.randint(10, 2000)}][{serial}][{rng.choice(MODULES)}]"
+        f"[OPENID:{rng.choice(['', 'oABC' + str(rng.randint(1000, 9999))])}]{message}"
+    )
+
+
+def make_log_lines(
+    count: int,
+    serials: int = 20,
+    seed: int = 0,
+    error_rate: float = 0.05,
+    start: Optional[datetime] = None,
+) -> List[str]:
+    """生成 count 行日志，分布在 serials 个流水号上；时间戳从 start 起单调递增，相邻两行间隔 1~40 毫秒"""
+    rng = random.Random(seed)
+    serial_ids = [f"DJC-CF-{rng.randint(10 ** 9, 10 ** 10)}-{rng.randint(0, 10 ** 6):06d}" for _ in range(serials)]
+    ts = start or datetime(2025, 12, 18, 10, 0, 0)
+    lines = []
+    for _ in range(count):
+        lines.append(make_log_line(ts, rng.choice(serial_ids), rng, error_rate=error_rate))
+        ts += timedelta(milliseconds=rng.randint(1, 40))
+    return lines
+
+
+def make_log_result(count: int, seed: int = 0, json_headers: int = 2, error_rate: float = 0.05) -> bytes:
+    """生成 curl2.php 风格的 var log_result= 响应字节"""
+    rng = random.Random(seed)
+    items = [{"content": line} for line in make_log_lines(count, seed=seed, error_rate=error_rate)]
+    for i in range(json_headers):
+        items.insert(rng.randint(0, len(items)), {
+            "jsonHeader": {
+                "host": f"10.0.0.{i + 1}",
+                "module": rng.choice(MODULES),
+                "params": {"actId": rng.randint(10000, 99999), "serial": f"DJC-{i}"},
+            }
+        })
+    log_data = {"ret": 0, "msg": "ok", "total": len(items), "result": items}
+    return ("var log_result=" + json.dumps(log_data, ensure_ascii=False)).encode("utf-8")
@@ -0,0 +1,54 @@
+"""
+请求合并（single-flight）
+- 同一个 key 同时只有一个真实请求在执行
+- 并发调用者共享同一个结果（或同一个异常）
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    合并同一 key 的并发异步调用
+
+    示例:
+        flight = SingleFlight()
+        result = await flight.do(("DJC", event_id), lambda: fetch(event_id))
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0    # 实际执行次数
+        self.shared = 0   # 复用进行中请求的次数
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn()，若相同 key 已有请求在进行中，则等待并共享其结果"""
+        future = self._inflight.get(key)
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            # 作为独立任务运行：某个调用者被取消时，不影响其他等待者
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        """请求完成后移除，之后的调用会重新执行"""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        """合并统计信息"""
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "inflight": len(self._inflight),
+        }
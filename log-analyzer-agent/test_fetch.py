@@ -1,70 +1,91 @@
 """
 测试日志获取功能
-用法: python test_fetch.py <event_id>
+用法: python test_fetch.py [event_id] [--bench N] [--concurrency C] [--url URL] [--save DIR]
 示例: python test_fetch.py DJC-CF-1211212348-8RJKIC-529-425718
+      python test_fetch.py DJC-CF-1211212348-8RJKIC-529-425718 --bench 200 --concurrency 20
+
+--save DIR 把原始响应保存为 DIR/<EventID>.js，可用 fake_log_service.py --replay DIR 回放。
+
+--bench 模式下并发请求 N 次，按阶段统计耗时分布（p50/p95/p99）：
+- connect:  TCP/TLS 建连（复用连接时为 0）
+- ttfb:     发出请求到收到响应头
+- download: 读取响应体
+- decode:   JSON 解码 log_result
+- join:     提取 content 并拼接为文本
+用于判断瓶颈在网络还是本地解析。压测直接使用会话的连接池，不经过缓存、限流和熔断。
 """
 
 import os
 import sys
 import json
-import requests
-from dotenv import load_dotenv
+import math
+import time
+import asyncio
+import argparse
+from typing import Dict, List
 
-load_dotenv()
+import httpx
 
-LOG_SERVICE_URL = "http://help.ied.com/logplat/curl2.php"
-AUTH_COOKIE = os.getenv("LOG_SERVICE_COOKIE", "")
+import json_codec
+from log_service import (
+    LOG_RESULT_PREFIX,
+    LOGIN_SNIFF_BYTES,
+    format_log_item,
+    get_log_client,
+    parse_plat_name,
+)
 
+BENCH_PHASES = ["connect", "ttfb", "download", "decode", "join", "total"]
 
-def fetch_error_log(event_id: str) -> str:
-    """根据 EventID 获取日志"""
-    # 解析平台名
-    plat_name = event_id.split("-")[0] if "-" in event_id else "AMS"
-    
-    params = {
-        "url": f"plat_name={plat_name}&serial_num={event_id}&source_charset=utf8",
-        "set": "",
-        "referer": "http://help.ied.com/helpv2/html/showInfo_v2.html"
-    }
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-        "Referer": "http://help.ied.com/helpv2/html/showInfo_v2.html"
-    }
+
+def fetch_error_log(event_id: str, save_dir: str = "") -> str:
+    """根据 EventID 获取日志（与 main.py 共享同一个日志服务会话），save_dir 非空时保存原始响应"""
+    session = get_log_client()
+    plat_name = parse_plat_name(event_id)
     
-    if AUTH_COOKIE:
-        headers["Cookie"] = AUTH_COOKIE
-        print(f"✅ 使用 Cookie 认证 (长度: {len(AUTH_COOKIE)})")
+    if session.has_cookie:
+        print(f"✅ 使用 Cookie 认证 (长度: {len(session.cookie_header())})")
     else:
         print("⚠️  未设置 LOG_SERVICE_COOKIE，可能需要登录")
     
-    print(f"📡 请求 URL: {LOG_SERVICE_URL}")
+    print(f"📡 请求 URL: {session.base_url}")
     print(f"   EventID: {event_id}")
     print(f"   Platform: {plat_name}")
     print("-" * 60)
     
     try:
-        response = requests.get(LOG_SERVICE_URL, params=params, headers=headers, timeout=30)
+        response = session.get_sync(event_id)
         print(f"状态码: {response.status_code}")
         print("-" * 60)
         
-        content = response.text
+        # 直接使用响应字节：请求已指定 source_charset=utf8，
+        # 避免 response.text 在缺少 charset 时对整个响应做编码探测
+        body = response.content
+        head = body[:LOGIN_SNIFF_BYTES]
+        
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            path = os.path.join(save_dir, f"{event_id}.js")
+            with open(path, "wb") as f:
+                f.write(body)
+            print(f"💾 原始响应已保存: {path} ({len(body)} 字节)")
         
         # 检查登录状态
-        if "未找到登录" in content or '"ret":-10' in content:
+        if "未找到登录".encode("utf-8") in head or b'"ret":-10' in head:
             print("❌ 需要登录认证！")
             print("请在 .env 文件中设置 LOG_SERVICE_COOKIE")
             print("\n获取方式：")
             print("1. 浏览器打开日志页面并登录")
             print("2. F12 -> Network -> 找到 curl2.php 请求")
             print("3. 复制 Cookie 值到 .env")
-            return content
+            return head.decode("utf-8", errors="replace")
         
-        # 解析 JavaScript 变量
-        if content.startswith("var log_result="):
-            json_str = content[len("var log_result="):]
+        content = body.decode("utf-8", errors="replace")
+        
+        # 解析 JavaScript 变量：与 main.py 和压测使用同一个解码器（见 json_codec），直接解码响应字节
+        if body.startswith(LOG_RESULT_PREFIX.encode("utf-8")):
             try:
-                log_data = json.loads(json_str)
+                log_data = json_codec.loads(body, offset=len(LOG_RESULT_PREFIX))
                 print("✅ 成功解析日志数据")
                 print(f"返回码: {log_data.get('ret', 'N/A')}")
                 print(f"消息: {log_data.get('msg', 'N/A')}")
@@ -78,9 +99,9 @@ def fetch_error_log(event_id: str) -> str:
                         if "content" in item:
                             print(item["content"][:500])
                         else:
-                            print(json.dumps(item, ensure_ascii=False, indent=2)[:500])
+                            print(json_codec.dumps(item, indent=True)[:500])
                 
-                return json.dumps(log_data, ensure_ascii=False, indent=2)
+                return json_codec.dumps(log_data, indent=True)
             except json.JSONDecodeError as e:
                 print(f"JSON 解析失败: {e}")
                 return content
@@ -89,16 +110,128 @@ def fetch_error_log(event_id: str) -> str:
         print(content[:2000])
         return content
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"❌ 请求失败: {e}")
         return ""
 
 
+# ============ 压测 ============
+async def timed_fetch(event_id: str) -> Dict[str, float]:
+    """请求一次日志，返回各阶段耗时（秒）和响应字节数；响应体无法解码时抛出 json.JSONDecodeError"""
+    session = get_log_client()
+    marks: Dict[str, float] = {}
+    
+    async def trace(event_name: str, info: dict):
+        # httpcore 的事件如 connection.connect_tcp.started / http11.receive_response_headers.complete
+        marks.setdefault(event_name, time.perf_counter())
+    
+    start = time.perf_counter()
+    async with session.client.stream(
+        "GET",
+        session.base_url,
+        extensions={"trace": trace},
+        **session.request_kwargs(event_id)
+    ) as response:
+        headers_done = time.perf_counter()
+        body = await response.aread()
+    body_done = time.perf_counter()
+    
+    items = []
+    if body.startswith(LOG_RESULT_PREFIX.encode("utf-8")):
+        log_data = json_codec.loads(body, offset=len(LOG_RESULT_PREFIX))
+        items = log_data.get("result", []) if isinstance(log_data, dict) else []
+    decode_done = time.perf_counter()
+    
+    text = "\n".join(line for line in map(format_log_item, items) if line is not None)
+    join_done = time.perf_counter()
+    
+    connect_start = marks.get("connection.connect_tcp.started")
+    connect_end = marks.get("connection.start_tls.complete") or marks.get("connection.connect_tcp.complete")
+    send_start = marks.get("http11.send_request_headers.started") or marks.get("http2.send_request_headers.started") or start
+    return {
+        "connect": connect_end - connect_start if connect_start and connect_end else 0.0,
+        "ttfb": headers_done - send_start,
+        "download": body_done - headers_done,
+        "decode": decode_done - body_done,
+        "join": join_done - decode_done,
+        "total": join_done - start,
+        "bytes": len(body),
+        "chars": len(text),
+        "status": response.status_code,
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def run_benchmark(event_ids: List[str], requests_count: int, concurrency: int):
+    """以 concurrency 并发请求 requests_count 次，打印各阶段耗时分布"""
+    session = get_log_client()
+    slots = asyncio.Semaphore(concurrency)
+    samples: List[Dict[str, float]] = []
+    errors: List[str] = []
+    
+    async def one(i: int):
+        async with slots:
+            try:
+                samples.append(await timed_fetch(event_ids[i % len(event_ids)]))
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                # 单个响应体损坏只计为一次失败，不中断整个压测
+                errors.append(f"{type(e).__name__}: {e}")
+    
+    print(f"🏁 压测 {session.base_url}")
+    print(f"   请求数: {requests_count}, 并发: {concurrency}, EventID 数: {len(event_ids)}")
+    print("-" * 60)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests_count)))
+    elapsed = time.perf_counter() - start
+    await session.aclose()
+    
+    ok = [s for s in samples if 200 <= s["status"] < 300]
+    total_bytes = sum(s["bytes"] for s in samples)
+    print(f"{'阶段':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}  (ms)")
+    for phase in BENCH_PHASES:
+        values = [s[phase] * 1000 for s in samples]
+        mean = sum(values) / len(values) if values else 0.0
+        print(
+            f"{phase:<10}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}"
+            f"{percentile(values, 99):>10.2f}{mean:>10.2f}"
+        )
+    print("-" * 60)
+    print(f"成功: {len(ok)}, 非 2xx: {len(samples) - len(ok)}, 网络/解码错误: {len(errors)}")
+    print(f"耗时: {elapsed:.2f}s, 吞吐: {len(samples) / elapsed:.1f} req/s, {total_bytes / elapsed / 1024 / 1024:.2f} MB/s")
+    if samples:
+        print(f"每个 EventID 平均响应大小: {total_bytes / len(samples) / 1024:.1f} KB")
+    for error in errors[:5]:
+        print(f"   ❌ {error}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="测试日志获取 / 压测日志服务")
+    parser.add_argument("event_id", nargs="?", default="DJC-CF-1211212348-8RJKIC-529-425718")
+    parser.add_argument("--bench", type=int, default=0, metavar="N", help="压测模式：请求 N 次")
+    parser.add_argument("--concurrency", type=int, default=10, help="压测并发数")
+    parser.add_argument("--url", help="日志服务地址（默认 LOG_SERVICE_URL，可指向本地替身服务）")
+    parser.add_argument("--event-ids", metavar="FILE", help="压测时轮流使用的 EventID 列表文件（每行一个）")
+    parser.add_argument("--save", metavar="DIR", default="", help="保存原始响应，供 fake_log_service.py --replay 回放")
+    args = parser.parse_args()
+    
+    if args.url:
+        get_log_client().base_url = args.url
     if len(sys.argv) < 2:
-        event_id = "DJC-CF-1211212348-8RJKIC-529-425718"
-        print(f"使用默认 EventID: {event_id}\n")
-    else:
-        event_id = sys.argv[1]
+        print(f"使用默认 EventID: {args.event_id}\n")
     
-    fetch_error_log(event_id)
+    if args.bench:
+        event_ids = [args.event_id]
+        if args.event_ids:
+            with open(args.event_ids, encoding="utf-8") as f:
+                event_ids = [line.strip() for line in f if line.strip()] or event_ids
+        asyncio.run(run_benchmark(event_ids, args.bench, args.concurrency))
+    else:
+        fetch_error_log(args.event_id, save_dir=args.save)
@@ -0,0 +1,118 @@
+"""
+工具结果的 token 预算
+- 每次工具调用的结果都会追加到对话里，并在之后的每轮迭代中重复发送给模型
+- 超出预算的结果按行裁剪：优先保留标记行、各类 ERROR 的首次/末次出现、每个模块的首行，
+  其次是其余 ERROR、WARN 和首尾行，按原始顺序输出并附带截断标记
+"""
+
+import os
+from typing import Dict, List, Sequence, Tuple
+
+from log_digest import render_selection
+from log_parser import LEVEL_ERROR, LEVEL_WARN, LogRecord, parse_lines
+
+# ============ 配置 ============
+# 单个工具结果的 token 上限，0 表示不限制
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "8000"))
+# 单行最多保留的字符数（如很长的 jsonHeader），超出部分截掉
+MAX_LINE_CHARS = int(os.getenv("TOOL_RESULT_MAX_LINE_CHARS", "2000"))
+
+# 截断标记与省略行预留的 token
+_MARKER_TOKENS = 80
+_GAP_TOKENS = 8
+# 总是优先保留的行（摘要统计、错误码说明、日志模板、调用链、步骤耗时、下载截断、错误提示）
+_MARKER_PREFIXES = (
+    "[DIGEST]", "[KB]", "[TEMPLATES]", "[#", "[CHAIN", "  → ", "[LATENCY]", "[SLOW",
+    "[TRUNCATED]", "[ERROR]", "未发现",
+)
+# 首尾各保留的行数
+_EDGE_LINES = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估计 token 数：ASCII 约 4 字符 1 个 token，中文等非 ASCII 字符约 1 字符 1 个 token
+
+    只做一次 encode，不依赖具体模型的分词器。
+    """
+    chars = len(text)
+    # CJK 字符 UTF-8 编码为 3 字节，多出的字节数 / 2 约等于非 ASCII 字符数
+    non_ascii = (len(text.encode("utf-8")) - chars) // 2
+    return (chars - non_ascii) // 4 + non_ascii + 1
+
+
+def _clip_line(line: str) -> str:
+    if len(line) <= MAX_LINE_CHARS:
+        return line
+    return f"{line[:MAX_LINE_CHARS]}…(截掉 {len(line) - MAX_LINE_CHARS} 字符)"
+
+
+def _priority_order(lines: Sequence[str], records: Sequence[LogRecord]) -> List[int]:
+    """按保留优先级排列的行下标"""
+    total = len(lines)
+    markers: List[int] = []
+    # 同一位置（模块 + 源文件:行号）的 ERROR / WARN 视为同一类，记录首次和末次出现
+    error_spans: Dict[Tuple[str, str, int], List[int]] = {}
+    warn_spans: Dict[Tuple[str, str, int], List[int]] = {}
+    module_first: Dict[str, int] = {}
+    errors: List[int] = []
+
+    for i, (line, record) in enumerate(zip(lines, records)):
+        if line.startswith(_MARKER_PREFIXES):
+            markers.append(i)
+            continue
+        if not record.is_parsed:
+            continue
+        module_first.setdefault(record.module, i)
+        spans = error_spans if record.level == LEVEL_ERROR else warn_spans if record.level == LEVEL_WARN else None
+        if spans is not None:
+            span = spans.setdefault((record.module, record.src, record.line), [i, i])
+            span[1] = i
+        if record.level == LEVEL_ERROR:
+            errors.append(i)
+
+    order = [
+        *markers,
+        *(i for span in error_spans.values() for i in span),
+        *module_first.values(),
+        *errors,
+        *(i for span in warn_spans.values() for i in span),
+        *range(min(_EDGE_LINES, total)),
+        *range(max(0, total - _EDGE_LINES), total),
+        *range(total),
+    ]
+    return list(dict.fromkeys(order))
+
+
+def fit_to_budget(text: str, max_tokens: int = TOOL_RESULT_MAX_TOKENS) -> str:
+    """
+    把工具结果裁剪到 max_tokens 以内
+
+    未超出预算时原样返回；否则按优先级挑选行，按原始顺序输出，
+    省略的部分用 "... 省略 N 行 ..." 代替，末尾附带 [TOKEN_BUDGET] 截断标记。
+    """
+    if max_tokens <= 0:
+        return text
+    total_tokens = estimate_tokens(text)
+    if total_tokens <= max_tokens:
+        return text
+
+    lines = [_clip_line(line) for line in text.split("\n")]
+    records = list(parse_lines(lines))
+    remaining = max_tokens - _MARKER_TOKENS
+    selected = []
+    for i in _priority_order(lines, records):
+        cost = estimate_tokens(lines[i]) + _GAP_TOKENS
+        if cost <= remaining:
+            selected.append(i)
+            remaining -= cost
+    selected.sort()
+
+    kept_errors = sum(1 for i in selected if records[i].level == LEVEL_ERROR)
+    all_errors = sum(1 for record in records if record.level == LEVEL_ERROR)
+    output = render_selection(lines, selected)
+    output.append(
+        f"[TOKEN_BUDGET] 结果约 {total_tokens} tokens，超出预算 {max_tokens}，"
+        f"保留 {len(selected)}/{len(lines)} 行（ER {kept_errors}/{all_errors}）"
+    )
+    return "\n".join(output)